@@ -43,6 +43,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'portalapp.middleware.InstrumentationMiddleware',
+    'portalapp.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,12 +82,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    # Dispatches to the Token (JWTAuthentication), JWT (rest_framework_jwt),
+    # session or basic scheme based on the Authorization header.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'portalapp.backends.JWTAuthentication',
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'portalapp.backends.DispatchingAuthentication',
+    ),
 
+    # Request and response bodies may also be MessagePack, negotiated
+    # through Content-Type and Accept: application/msgpack.
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'portalapp.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'portalapp.renderers.MessagePackRenderer',
     ),
 
     'EXCEPTION_HANDLER': 'portalapp.exceptions.core_exception_handler',
@@ -116,6 +130,62 @@ DATABASES = {
     }
 }
 
+# Read replicas: extra DATABASES aliases that replicate 'default'. Safe
+# requests to views marked replica_reads read from one of them, e.g.
+#
+#     DATABASES['replica'] = {
+#         'ENGINE': 'django.db.backends.mysql', 'NAME': 'jobserachportaldb',
+#         'HOST': 'replica.internal', ...,
+#         'TEST': {'MIRROR': 'default'},
+#     }
+#     DATABASE_REPLICAS = ['replica']
+#
+# Clients stay on the primary for REPLICA_STICKY_SECONDS after a write. The
+# pin is kept in the default cache, which must be shared between workers
+# for it to hold across processes.
+
+DATABASE_ROUTERS = ['portalapp.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 10
+
+# Caches
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PROFILE_CACHE_TIMEOUT = 60 * 5
+
+# Sessions are read from the cache and written through to django_session,
+# so a request only touches the table on a cache miss. Expired rows are
+# purged in the background at most once per SESSION_PURGE_INTERVAL seconds,
+# triggered by logins (the only writes that create sessions). The limit is
+# kept in the default cache, so it holds per process with LocMemCache and
+# across processes only with a shared backend.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_PURGE_INTERVAL = 60 * 60
+
+JWT_USER_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60
+# Authenticated users are cached per process for JWT_USER_CACHE_TTL seconds.
+# With JWT_USER_CACHE_SHARED each hit is checked against a per-user version
+# in the default cache, which User saves and deletes bump, so deactivation
+# applies on the next request in every worker that shares that cache (with
+# LocMemCache, only in the worker that made the change). Changes that skip
+# the model signals, such as QuerySet.update(is_active=False), stay unseen
+# for up to the TTL unless backends.invalidate_user() is called for them;
+# without JWT_USER_CACHE_SHARED that window applies to every change made in
+# another worker.
+JWT_USER_CACHE_SHARED = True
+JWT_PAYLOAD_CACHE_SIZE = 4096
+JWT_PAYLOAD_CACHE_TTL = 300
+
+# Fraction of requests timed by portalapp.middleware.InstrumentationMiddleware.
+INSTRUMENTATION_SAMPLE_RATE = 0.0
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
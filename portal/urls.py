@@ -11,9 +11,25 @@ from django.conf.urls.static import static
 urlpatterns = [
 
     url(r'^register/?$', appview.RegistrationAPIView.as_view(), name='register'),
+    url(r'^register/batch/?$', appview.RegistrationBatchAPIView.as_view(), name='register-batch'),
     url(r'^user/?$', appview.UserRetrieveUpdateAPIView.as_view(), name='user'),
     url(r'^login/$', appview.LoginAPIView.as_view(), name='login'),
+    url(
+        r'^accounts/profile/(?P<section>experience|education|skills|projects)/?$',
+        appview.ProfileSectionAPIView.as_view(), name='profile-section'
+    ),
     url(r'^accounts/profile/', appview.ProfileRetrieveAPIView.as_view()),
+    url(r'^profiles/?$', appview.ProfileListAPIView.as_view(), name='profiles'),
+    url(r'^profiles/match/?$', appview.SkillMatchAPIView.as_view(), name='profiles-match'),
+    url(r'^profiles/batch/?$', appview.ProfileBatchAPIView.as_view(), name='profiles-batch'),
+    url(
+        r'^profiles/(?P<username>[^/]+)/similar/?$',
+        appview.SimilarProfilesAPIView.as_view(), name='profiles-similar'
+    ),
+    url(r'^facets/?$', appview.FacetsAPIView.as_view(), name='facets'),
+    url(r'^search/?$', appview.SearchAPIView.as_view(), name='search'),
+    url(r'^export/profiles/?$', appview.ProfileExportAPIView.as_view(), name='export-profiles'),
+    url(r'^metrics/?$', appview.MetricsAPIView.as_view(), name='metrics'),
 
     url(r'^auth-social/', include('social_django.urls', namespace='social')),
 
@@ -2,9 +2,18 @@ from django.contrib import admin
 
 # Register your models here.
 from .models import User, Profile, Basic, Experience, Education, Skill, Project
+from .pagination import EstimatedCountPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    # Changelists use an estimated count, and they skip the second
+    # unfiltered COUNT(*) that the "N total" link needs.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 @admin.register(User)
-class AllUsers(admin.ModelAdmin):
+class AllUsers(ScalableAdmin):
     list_display = [
         'username',
         'email',
@@ -12,11 +21,13 @@ class AllUsers(admin.ModelAdmin):
         'is_active',
         'is_staff',
     ]
+    list_filter = ('is_active', 'is_staff', 'is_superuser')
+    search_fields = ('^username', '^email')
     ordering = ('email',)
 
 
 @admin.register(Profile)
-class UserProfiles(admin.ModelAdmin):
+class UserProfiles(ScalableAdmin):
     list_display = [
         'id',
         'Email',
@@ -24,21 +35,40 @@ class UserProfiles(admin.ModelAdmin):
         'bio',
         'image',
     ]
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('^user__username', '^user__email')
+
     def Email(self, obj):
         return obj.user.email
+    Email.admin_order_field = 'user__email'
 
     def User(self, obj):
         return obj.user.username
+    User.admin_order_field = 'user__username'
+
+    # Walks the (-created_at, -updated_at) index instead of joining users.
+    ordering = ('-created_at',)
+
+
+class SectionAdmin(ScalableAdmin):
+    # Rows are listed with their profile's user in the same query and are
+    # found by username/email prefix search instead of a sidebar that lists
+    # every profile.
+    list_select_related = ('profile__user',)
+    raw_id_fields = ('profile',)
+    search_fields = ('^profile__user__username', '^profile__user__email')
+    ordering = ('profile_id',)
+
+    def username(self, obj):
+        return obj.profile.user.username
+    username.admin_order_field = 'profile__user__username'
 
-    ordering = ('user',)
-    list_filter = (
-        ('user', admin.RelatedFieldListFilter),
-    )
 
 @admin.register(Basic)
-class UserProfiles(admin.ModelAdmin):
+class UserBasics(SectionAdmin):
     list_display = [
-        'profile',
+        'username',
         'dob',
         'phone',
         'city',
@@ -46,17 +76,11 @@ class UserProfiles(admin.ModelAdmin):
         'interest',
         'website'
     ]
+    list_filter = ('state',)
 
-    def profile(self, obj):
-        return obj.profile.user.username
-
-    ordering = ('profile',)
-    list_filter = (
-        ('profile', admin.RelatedFieldListFilter),
-    )
 
 @admin.register(Experience)
-class UserProfiles(admin.ModelAdmin):
+class UserExperiences(SectionAdmin):
     list_display = [
         'username',
         'designation',
@@ -65,14 +89,9 @@ class UserProfiles(admin.ModelAdmin):
         'end_date',
     ]
 
-    def username(self, obj):
-        return obj.profile.user.username
-
-    ordering = ('profile',)
-
 
 @admin.register(Education)
-class UserProfiles(admin.ModelAdmin):
+class UserEducations(SectionAdmin):
     list_display = [
         'username',
         'education_level',
@@ -82,28 +101,18 @@ class UserProfiles(admin.ModelAdmin):
         'end_date'
     ]
 
-    def username(self, obj):
-        return obj.profile.user.username
-
-    ordering = ('profile',)
-
 
 @admin.register(Skill)
-class UserProfiles(admin.ModelAdmin):
+class UserSkills(SectionAdmin):
     list_display = [
         'username',
         'skill',
         'last_used',
     ]
 
-    def username(self, obj):
-        return obj.profile.user.username
-
-    ordering = ('profile',)
-
 
 @admin.register(Project)
-class UserProfiles(admin.ModelAdmin):
+class UserProjects(SectionAdmin):
     list_display = [
         'username',
         'headline',
@@ -113,8 +122,3 @@ class UserProfiles(admin.ModelAdmin):
         'ptype',
         'extra_info',
     ]
-
-    def username(self, obj):
-        return obj.profile.user.username
-
-    ordering = ('profile',)
\ No newline at end of file
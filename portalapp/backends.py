@@ -1,11 +1,61 @@
+import copy
+import hashlib
+import time
+
 import jwt
 
 from django.conf import settings
 
 from rest_framework import authentication, exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
 
+from . import routers
+from .cache import LRUCache, VersionedCache
+from .instrumentation import timed
 from .models import User
 
+USER_CACHE_TTL = getattr(settings, 'JWT_USER_CACHE_TTL', 60)
+# Used for tokens without an "exp" claim; the rest are kept until they expire.
+PAYLOAD_CACHE_TTL = getattr(settings, 'JWT_PAYLOAD_CACHE_TTL', 300)
+
+user_cache = LRUCache(getattr(settings, 'JWT_USER_CACHE_SIZE', 1024), USER_CACHE_TTL)
+
+# With JWT_USER_CACHE_SHARED every process checks a per-user version kept
+# in Django's cache, so a save in one worker evicts the user in all of them.
+# Without it a change made elsewhere is seen only once USER_CACHE_TTL passes.
+shared_user_cache = None
+if getattr(settings, 'JWT_USER_CACHE_SHARED', True):
+    shared_user_cache = VersionedCache('portalapp:jwt-user', USER_CACHE_TTL)
+
+payload_cache = LRUCache(getattr(settings, 'JWT_PAYLOAD_CACHE_SIZE', 4096), PAYLOAD_CACHE_TTL)
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def decode_token(scheme, digest, token, decode):
+    key = (scheme, digest)
+    payload = payload_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = decode(token)
+    ttl = PAYLOAD_CACHE_TTL
+    if 'exp' in payload:
+        ttl = payload['exp'] - time.time()
+    if ttl > 0:
+        payload_cache.set(key, payload, ttl)
+
+    return payload
+
+
+def invalidate_user(user_id):
+    user_cache.delete_where(lambda key: key[0] == user_id)
+    if shared_user_cache is not None:
+        shared_user_cache.bump(user_id)
+
 
 class JWTAuthentication(authentication.BaseAuthentication):
     authentication_header_prefix = 'Token'
@@ -33,15 +83,21 @@ class JWTAuthentication(authentication.BaseAuthentication):
         return self._authenticate_credentials(request, token)
 
     def _authenticate_credentials(self, request, token):
+        digest = token_digest(token)
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY)
-            print("payload: {}".format(payload))
+            payload = decode_token('token', digest, token, self._decode)
         except:
             msg = 'Invalid authentication. Could not decode token.'
             raise exceptions.AuthenticationFailed(msg)
 
+        # User.token issues an "id" claim; tokens minted elsewhere use "user_id".
+        user_id = payload.get('user_id', payload.get('id'))
+        if user_id is None:
+            msg = 'Invalid authentication. Token has no user.'
+            raise exceptions.AuthenticationFailed(msg)
+
         try:
-            user = User.objects.get(pk=payload['user_id'])
+            user = self._get_user(user_id, digest)
         except User.DoesNotExist:
             msg = 'No user matching this token was found.'
             raise exceptions.AuthenticationFailed(msg)
@@ -51,3 +107,111 @@ class JWTAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed(msg)
 
         return (user, token)
+
+    def _decode(self, token):
+        return jwt.decode(token, settings.SECRET_KEY)
+
+    def _get_user(self, user_id, token_hash):
+        routers.read_primary_for(user_id)
+        key = (user_id, token_hash)
+        version = None
+        if shared_user_cache is not None:
+            version = shared_user_cache.version(user_id)
+
+        cached = user_cache.get(key)
+        if cached is not None and cached[0] == version:
+            # Hand out copies so per-request state never leaks between requests.
+            return copy.copy(cached[1])
+
+        user = None
+        if shared_user_cache is not None:
+            shared_key = '{}:{}'.format(user_id, token_hash)
+            user = shared_user_cache.get(shared_key, version)
+
+        if user is None:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                # The pin lives in the cache, which need not be shared by
+                # the worker that registered the user.
+                if not routers.reading_replicas():
+                    raise
+                user = User.objects.using('default').get(pk=user_id)
+            # A user read from a lagging replica may predate the save that
+            # bumped `version`, so only primary reads are cached.
+            if routers.reading_replicas():
+                return user
+            if shared_user_cache is not None:
+                shared_user_cache.set(shared_key, version, user)
+
+        user_cache.set(key, (version, user))
+
+        return copy.copy(user)
+
+
+class DispatchingAuthentication(authentication.BaseAuthentication):
+    # Reads the Authorization header once and hands the request to the one
+    # scheme its prefix names, instead of letting every class in a chain
+    # parse the header and verify the token again.
+    def __init__(self):
+        self.token_backend = JWTAuthentication()
+        self.jwt_backend = JSONWebTokenAuthentication()
+        self.basic_backend = authentication.BasicAuthentication()
+        self.session_backend = authentication.SessionAuthentication()
+        self.schemes = {
+            self.token_backend.authentication_header_prefix.lower(): self._authenticate_token,
+            api_settings.JWT_AUTH_HEADER_PREFIX.lower(): self._authenticate_jwt,
+            'basic': self._authenticate_basic,
+        }
+
+    @timed('auth')
+    def authenticate(self, request):
+        auth_header = authentication.get_authorization_header(request).split()
+        handler = None
+        if auth_header:
+            handler = self.schemes.get(auth_header[0].decode('latin-1').lower())
+
+        if handler is None:
+            if not auth_header and api_settings.JWT_AUTH_COOKIE:
+                token = request.COOKIES.get(api_settings.JWT_AUTH_COOKIE)
+                if token:
+                    return self._verify_jwt(token)
+            return self.session_backend.authenticate(request)
+
+        return handler(request, auth_header)
+
+    def _authenticate_token(self, request, auth_header):
+        if len(auth_header) != 2:
+            return self.session_backend.authenticate(request)
+
+        return self.token_backend._authenticate_credentials(
+            request, auth_header[1].decode('utf-8')
+        )
+
+    def _authenticate_jwt(self, request, auth_header):
+        if len(auth_header) == 1:
+            msg = 'Invalid Authorization header. No credentials provided.'
+            raise exceptions.AuthenticationFailed(msg)
+        elif len(auth_header) > 2:
+            msg = 'Invalid Authorization header. Credentials string should not contain spaces.'
+            raise exceptions.AuthenticationFailed(msg)
+
+        return self._verify_jwt(auth_header[1].decode('utf-8'))
+
+    def _verify_jwt(self, token):
+        try:
+            payload = decode_token(
+                'jwt', token_digest(token), token, api_settings.JWT_DECODE_HANDLER
+            )
+        except jwt.ExpiredSignature:
+            raise exceptions.AuthenticationFailed('Signature has expired.')
+        except jwt.DecodeError:
+            raise exceptions.AuthenticationFailed('Error decoding signature.')
+        except jwt.InvalidTokenError:
+            raise exceptions.AuthenticationFailed()
+
+        routers.read_primary_for(api_settings.JWT_PAYLOAD_GET_USER_ID_HANDLER(payload))
+        return (self.jwt_backend.authenticate_credentials(payload), token)
+
+    def _authenticate_basic(self, request, auth_header):
+        return self.basic_backend.authenticate(request)
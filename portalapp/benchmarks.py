@@ -0,0 +1,226 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import User, Profile, Basic, Experience, Education, Skill, Project
+
+CITIES = [
+    'Bengaluru', 'Mumbai', 'Pune', 'Hyderabad', 'Chennai', 'Nagpur', 'Delhi',
+    'Kolkata', 'Ahmedabad', 'Jaipur', 'Kochi', 'Indore',
+]
+SKILLS = [
+    'Python', 'Django', 'Java', 'Spring', 'JavaScript', 'React', 'Angular', 'SQL',
+    'MySQL', 'PostgreSQL', 'Docker', 'Kubernetes', 'AWS', 'Go', 'Rust', 'C++',
+    'Scala', 'Spark', 'Hadoop', 'Kafka', 'Redis', 'Linux', 'Android', 'Swift',
+]
+COMPANIES = [
+    'SAP', 'Infosys', 'TCS', 'Wipro', 'Flipkart', 'Amazon', 'Google', 'Microsoft',
+    'Swiggy', 'Zomato', 'Ola', 'Paytm', 'Oracle', 'Adobe', 'Intuit', 'Cisco',
+]
+DESIGNATIONS = [
+    'Software Developer', 'Senior Software Developer', 'Data Engineer',
+    'Backend Engineer', 'Frontend Engineer', 'DevOps Engineer', 'Architect',
+]
+INSTITUTES = [
+    'VNIT Nagpur', 'IIT Bombay', 'IIT Delhi', 'NIT Trichy', 'BITS Pilani',
+    'IIIT Hyderabad', 'NIT Surathkal', 'COEP Pune', 'DTU Delhi', 'RVCE Bengaluru',
+]
+BRANCHES = ['Computer Science Engineering', 'Electronics', 'Mechanical', 'Information Technology']
+WORDS = [
+    'platform', 'search', 'payments', 'analytics', 'realtime', 'mobile', 'portal',
+    'recommendation', 'pipeline', 'dashboard', 'api', 'migration', 'cache', 'scaling',
+]
+
+
+@contextmanager
+def test_database(threaded=False):
+    # Benchmarks seed thousands of rows, so they run against a throwaway
+    # copy of the configured database the same way the test runner does.
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    directory = None
+    if threaded and connection.vendor == 'sqlite' and not old_test_name:
+        # Each thread opens its own connection, and on Python 2 SQLite
+        # cannot share an in-memory database between connections.
+        directory = tempfile.mkdtemp()
+        test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        connection.settings_dict.setdefault('OPTIONS', {}).setdefault('timeout', 30)
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+@contextmanager
+def timer(results, name):
+    start = time.time()
+    yield
+    results[name] = time.time() - start
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _random_date(rng, years_back):
+    return date.today() - timedelta(days=rng.randint(0, 365 * years_back))
+
+
+def _random_span(rng, years_back, max_years):
+    start = _random_date(rng, years_back)
+    end = min(start + timedelta(days=rng.randint(90, 365 * max_years)), date.today())
+    return start, end
+
+
+def seed_profiles(count, sections=3, seed=0, prefix='bench', chunk_size=500):
+    rng = random.Random(seed)
+    password = make_password('password123')
+    states = [state for state, _ in Basic.STATES]
+    profile_ids = []
+
+    for offset in range(0, count, chunk_size):
+        usernames = [
+            '{}{}'.format(prefix, i) for i in range(offset, min(offset + chunk_size, count))
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=username, email='{}@example.com'.format(username), password=password)
+                for username in usernames
+            ])
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('pk', flat=True))
+            Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids])
+            ids = list(Profile.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+
+            Basic.objects.bulk_create([
+                Basic(profile_id=pk, city=rng.choice(CITIES), state=rng.choice(states))
+                for pk in ids
+            ])
+            Experience.objects.bulk_create([
+                Experience(
+                    profile_id=pk,
+                    company=rng.choice(COMPANIES),
+                    designation=rng.choice(DESIGNATIONS),
+                    start_date=start,
+                    end_date=end,
+                )
+                for pk in ids for start, end in [_random_span(rng, 12, 4) for _ in range(sections)]
+            ])
+            Education.objects.bulk_create([
+                Education(
+                    profile_id=pk,
+                    institute=rng.choice(INSTITUTES),
+                    branch=rng.choice(BRANCHES),
+                    start_date=start,
+                    end_date=end,
+                )
+                for pk in ids for start, end in [_random_span(rng, 16, 4)]
+            ])
+            Skill.objects.bulk_create([
+                Skill(profile_id=pk, skill=rng.choice(SKILLS), last_used=_random_date(rng, 6))
+                for pk in ids for _ in range(sections * 2)
+            ])
+            Project.objects.bulk_create([
+                Project(
+                    profile_id=pk,
+                    headline='{} {}'.format(rng.choice(SKILLS), rng.choice(WORDS)),
+                    description=' '.join(rng.choice(WORDS) for _ in range(12)),
+                )
+                for pk in ids for _ in range(sections)
+            ])
+        profile_ids += ids
+
+    return profile_ids
+
+
+def summarize(latencies, queries, errors, elapsed):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    count = len(latencies)
+    return OrderedDict([
+        ('requests', count),
+        ('errors', errors),
+        ('throughput_rps', round(count / elapsed, 1) if elapsed else 0.0),
+        ('p50_ms', round(percentile(latencies_ms, 0.50), 2)),
+        ('p95_ms', round(percentile(latencies_ms, 0.95), 2)),
+        ('p99_ms', round(percentile(latencies_ms, 0.99), 2)),
+        ('queries_per_request', round(float(sum(queries)) / count, 2) if count else 0.0),
+    ])
+
+
+def run_load(send, requests, workers):
+    # Each worker calls send(worker_index, request_index) and the response
+    # status decides whether it counts as an error.
+    latencies = []
+    queries = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def work(worker):
+        try:
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+
+                failed = False
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.time()
+                    try:
+                        failed = send(worker, index).status_code >= 400
+                    except Exception:
+                        # The test client re-raises view exceptions.
+                        failed = True
+                    latency = time.time() - start
+
+                with lock:
+                    latencies.append(latency)
+                    queries.append(len(captured))
+                    errors[0] += failed
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(workers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(latencies, queries, errors[0], time.time() - start)
+
+
+def compare(results, baseline):
+    changes = OrderedDict()
+    for endpoint, metrics in results.get('endpoints', {}).items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous:
+            continue
+
+        changes[endpoint] = OrderedDict()
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            if previous.get(metric):
+                change = (metrics[metric] - previous[metric]) / float(previous[metric])
+                changes[endpoint][metric] = round(change * 100, 1)
+    return changes
@@ -0,0 +1,383 @@
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, Value, When
+from django.utils import six, timezone
+
+from .cache import profile_cache
+from .models import User, Profile, Basic, Experience, Education, Skill, Project
+from .serializers import BulkRegistrationSerializer, ImportUserSerializer
+from .serializers import BasicSerializer, ExperienceSerializer, EducationSerializer
+from .serializers import SkillSerializer, ProjectSerializer
+from .signals import profiles_changed
+
+SECTION_MODELS = (Basic, Experience, Education, Skill, Project)
+LIST_SECTIONS = (
+    ('experience', Experience, ExperienceSerializer),
+    ('education', Education, EducationSerializer),
+    ('skills', Skill, SkillSerializer),
+    ('projects', Project, ProjectSerializer),
+)
+
+
+def _unique_error(field_name):
+    field = User._meta.get_field(field_name)
+    return field.error_messages['unique'] % {
+        'model_name': User._meta.verbose_name,
+        'field_label': field.verbose_name,
+    }
+
+
+def create_profiles(users):
+    Profile.objects.bulk_create([Profile(user=user) for user in users])
+    profiles = list(Profile.objects.filter(user__in=[user.pk for user in users]))
+
+    for model in SECTION_MODELS:
+        model.objects.bulk_create([model(profile=profile) for profile in profiles])
+
+    # bulk_create sends no post_save, so derived data is refreshed here.
+    profiles_changed([profile.pk for profile in profiles])
+
+    return profiles
+
+
+def _taken(candidates):
+    return {
+        'email': set(User.objects.filter(
+            email__in=[data['email'] for _, data in candidates]
+        ).values_list('email', flat=True)),
+        'username': set(User.objects.filter(
+            username__in=[data['username'] for _, data in candidates]
+        ).values_list('username', flat=True)),
+    }
+
+
+def _taken_errors(user):
+    return {
+        field_name: [_unique_error(field_name)]
+        for field_name in ('email', 'username')
+        if User.objects.filter(**{field_name: getattr(user, field_name)}).exists()
+    }
+
+
+def _with_profiles(users):
+    # bulk_create does not hand primary keys back on MySQL.
+    users = list(User.objects.filter(username__in=[user.username for user in users]))
+    create_profiles(users)
+    return users
+
+
+def register_users(rows):
+    failed = []
+    candidates = []
+    for index, row in enumerate(rows):
+        serializer = BulkRegistrationSerializer(data=row)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            data['email'] = User.objects.normalize_email(data['email'])
+            candidates.append((index, data))
+        else:
+            failed.append({'index': index, 'errors': serializer.errors})
+
+    taken = _taken(candidates)
+
+    entries = []
+    for index, data in candidates:
+        errors = {}
+        for field_name in ('email', 'username'):
+            if data[field_name] in taken[field_name]:
+                errors[field_name] = [_unique_error(field_name)]
+        if errors:
+            failed.append({'index': index, 'errors': errors})
+            continue
+
+        taken['email'].add(data['email'])
+        taken['username'].add(data['username'])
+        entries.append((index, User(
+            email=data['email'],
+            username=data['username'],
+            password=make_password(data['password']),
+        )))
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in entries])
+            users = _with_profiles([user for _, user in entries])
+    except IntegrityError:
+        # Another registration took one of the emails or usernames after
+        # they were checked; insert row by row so only those rows fail.
+        with transaction.atomic():
+            inserted = []
+            for index, user in entries:
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_create([user])
+                except IntegrityError:
+                    errors = _taken_errors(user)
+                    if not errors:
+                        raise
+                    failed.append({'index': index, 'errors': errors})
+                else:
+                    inserted.append(user)
+            users = _with_profiles(inserted)
+
+    position = {user.username: i for i, (_, user) in enumerate(entries)}
+    users.sort(key=lambda user: position[user.username])
+    created = [{'email': user.email, 'username': user.username} for user in users]
+    failed.sort(key=lambda failure: failure['index'])
+
+    return created, failed
+
+
+def bulk_update(objs, fields, batch_size=None):
+    # Django 1.11 has no QuerySet.bulk_update; this issues the same
+    # UPDATE ... SET field = CASE pk WHEN ... query per batch that it does.
+    if not objs:
+        return
+
+    model = type(objs[0])
+    fields = [model._meta.get_field(name) for name in fields]
+    connection = connections[router.db_for_write(model)]
+    max_batch_size = connection.ops.bulk_batch_size(['pk', 'pk'] + fields, objs)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+        for field in fields:
+            whens = [
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                for obj in batch
+            ]
+            updates[field.attname] = Case(*whens, output_field=field)
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+def delete_where_in(model, field_name, values):
+    # A plain DELETE, like bulk_create and bulk_update it sends no signals:
+    # QuerySet.delete() would load every row to send post_delete for each,
+    # and callers refresh the affected profiles once instead.
+    if not values:
+        return
+
+    column = model._meta.get_field(field_name).column
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    batch_size = connection.ops.bulk_batch_size([column], values)
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            batch = list(values[start:start + batch_size])
+            cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(
+                quote_name(model._meta.db_table),
+                quote_name(column),
+                ', '.join(['%s'] * len(batch)),
+            ), batch)
+
+
+def _validate_import_row(row):
+    if not isinstance(row, dict):
+        return None, {'error': ['Expected a JSON object.']}
+
+    errors = {}
+    data = {'sections': {}}
+
+    user = ImportUserSerializer(data=row)
+    if user.is_valid():
+        data['user'] = user.validated_data
+        data['user']['email'] = User.objects.normalize_email(data['user']['email'])
+    else:
+        errors.update(user.errors)
+
+    bio = row.get('bio', None)
+    if bio is not None and not isinstance(bio, six.string_types):
+        errors['bio'] = ['Not a valid string.']
+    data['bio'] = bio
+
+    basic = BasicSerializer(data=row.get('basic') or {}, partial=True)
+    if basic.is_valid():
+        data['basic'] = basic.validated_data
+    else:
+        errors['basic'] = basic.errors
+
+    for key, model, serializer_class in LIST_SECTIONS:
+        if key not in row:
+            data['sections'][key] = None
+            continue
+
+        section = serializer_class(data=row[key], many=True)
+        if section.is_valid():
+            data['sections'][key] = section.validated_data
+        else:
+            errors[key] = section.errors
+
+    return data, errors
+
+
+def import_profiles(rows):
+    # Rows whose email already exists update that profile: bio and the given
+    # basic fields are overwritten and each list section present in the row
+    # replaces the stored one. Everything else creates a new user.
+    failed = []
+    candidates = []
+    seen_emails = set()
+    for key, row in rows:
+        data, errors = _validate_import_row(row)
+        if not errors and data['user']['email'] in seen_emails:
+            errors = {'email': ['Duplicate email in this batch.']}
+        if errors:
+            failed.append({'key': key, 'errors': errors})
+            continue
+
+        seen_emails.add(data['user']['email'])
+        candidates.append((key, data))
+
+    existing = dict(User.objects.filter(email__in=seen_emails).values_list('email', 'pk'))
+    new_usernames = [
+        data['user']['username'] for _, data in candidates
+        if data['user']['email'] not in existing
+    ]
+    taken = set(User.objects.filter(username__in=new_usernames).values_list('username', flat=True))
+
+    new_rows = []
+    existing_rows = []
+    for key, data in candidates:
+        user = data['user']
+        if user['email'] in existing:
+            data['user_id'] = existing[user['email']]
+            existing_rows.append(data)
+        elif user['username'] in taken:
+            failed.append({'key': key, 'errors': {'username': [_unique_error('username')]}})
+        else:
+            taken.add(user['username'])
+            new_rows.append(data)
+
+    now = timezone.now()
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                email=data['user']['email'],
+                username=data['user']['username'],
+                password=make_password(data['user'].get('password')),
+            )
+            for data in new_rows
+        ])
+        user_ids = dict(User.objects.filter(
+            username__in=[data['user']['username'] for data in new_rows]
+        ).values_list('username', 'pk'))
+        for data in new_rows:
+            data['user_id'] = user_ids[data['user']['username']]
+
+        Profile.objects.bulk_create([
+            Profile(user_id=data['user_id'], bio=data['bio'] or '') for data in new_rows
+        ])
+        profile_ids = dict(Profile.objects.filter(
+            user_id__in=[data['user_id'] for data in new_rows + existing_rows]
+        ).values_list('user_id', 'pk'))
+        for data in new_rows + existing_rows:
+            data['profile_id'] = profile_ids[data['user_id']]
+
+        bulk_update([
+            Profile(pk=data['profile_id'], bio=data['bio'], updated_at=now)
+            for data in existing_rows if data['bio'] is not None
+        ], ['bio', 'updated_at'])
+
+        basics = {
+            basic.profile_id: basic for basic in
+            Basic.objects.filter(profile_id__in=[data['profile_id'] for data in existing_rows])
+        }
+        changed_basics = []
+        new_basics = []
+        for data in new_rows + existing_rows:
+            basic = basics.get(data['profile_id'])
+            if basic is None:
+                new_basics.append(Basic(profile_id=data['profile_id'], **data['basic']))
+            elif data['basic']:
+                for field, value in data['basic'].items():
+                    setattr(basic, field, value)
+                basic.updated_at = now
+                changed_basics.append(basic)
+        Basic.objects.bulk_create(new_basics)
+        bulk_update(changed_basics, list(BasicSerializer.Meta.fields) + ['updated_at'])
+
+        for key, model, _ in LIST_SECTIONS:
+            replaced = [
+                data['profile_id'] for data in existing_rows
+                if data['sections'][key] is not None
+            ]
+            delete_where_in(model, 'profile', replaced)
+            model.objects.bulk_create([
+                model(profile_id=data['profile_id'], **entry)
+                for data in new_rows + existing_rows
+                for entry in data['sections'][key] or []
+            ])
+
+        profiles_changed([data['profile_id'] for data in new_rows + existing_rows])
+        updated_user_ids = [data['user_id'] for data in existing_rows]
+        transaction.on_commit(lambda: [profile_cache.bump(pk) for pk in updated_user_ids])
+
+    return (
+        [data['user']['username'] for data in new_rows],
+        [data['user']['username'] for data in existing_rows],
+        failed,
+    )
+
+
+def _section_values(obj, fields):
+    # to_python normalises what a default left behind (DateField defaults
+    # hold datetimes until the row is reloaded) so rows compare by value.
+    return tuple(field.to_python(getattr(obj, field.attname)) for field in fields)
+
+
+def sync_section(profile, key, entries):
+    # Brings one list section of a profile in line with `entries` (the
+    # validated data of its serializer) using as few writes as possible:
+    # entries equal to a stored row are left alone, the remaining ones
+    # overwrite the remaining stored rows in order, and only the surplus is
+    # created or deleted.
+    model, serializer_class = {
+        section_key: (section_model, section_serializer)
+        for section_key, section_model, section_serializer in LIST_SECTIONS
+    }[key]
+    fields = [
+        model._meta.get_field(name) for name in serializer_class.Meta.fields
+        if name not in serializer_class._declared_fields
+    ]
+
+    incoming = [model(profile_id=profile.pk, **entry) for entry in entries]
+    with transaction.atomic():
+        stored = {}
+        for obj in model.objects.filter(profile_id=profile.pk).order_by('pk').select_for_update():
+            stored.setdefault(_section_values(obj, fields), []).append(obj)
+
+        unmatched = []
+        for obj in incoming:
+            rows = stored.get(_section_values(obj, fields))
+            if rows:
+                rows.pop(0)
+            else:
+                unmatched.append(obj)
+        leftover = sorted((obj for rows in stored.values() for obj in rows), key=lambda obj: obj.pk)
+
+        now = timezone.now()
+        changed_fields = set()
+        updated = []
+        for target, source in zip(leftover, unmatched):
+            for field in fields:
+                value = getattr(source, field.attname)
+                if field.to_python(value) != field.to_python(getattr(target, field.attname)):
+                    setattr(target, field.attname, value)
+                    changed_fields.add(field.name)
+            target.updated_at = now
+            updated.append(target)
+        created = unmatched[len(updated):]
+        deleted = [obj.pk for obj in leftover[len(updated):]]
+
+        bulk_update(updated, sorted(changed_fields) + ['updated_at'])
+        model.objects.bulk_create(created)
+        delete_where_in(model, model._meta.pk.name, deleted)
+
+        if updated or created or deleted:
+            profiles_changed([profile.pk])
+            user_id = profile.user_id
+            transaction.on_commit(lambda: profile_cache.bump(user_id))
+
+    return {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
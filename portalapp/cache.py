@@ -0,0 +1,109 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class VersionedCache(object):
+    def __init__(self, prefix, timeout):
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _version_key(self, key):
+        return '{}:{}:version'.format(self.prefix, key)
+
+    def _data_key(self, key, version):
+        return '{}:{}:{}'.format(self.prefix, key, version)
+
+    def _initial_version(self):
+        # Seeding from the clock keeps a version that fell out of the cache
+        # from ever coming back around to a number a stale entry still uses.
+        return int(time.time() * 1000)
+
+    def version(self, key):
+        version_key = self._version_key(key)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, self._initial_version(), None)
+            version = cache.get(version_key)
+        return version
+
+    def bump(self, key):
+        version_key = self._version_key(key)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, self._initial_version(), None)
+
+    def get(self, key, version):
+        data = cache.get(self._data_key(key, version))
+        with self._lock:
+            if data is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return data
+
+    def set(self, key, version, data):
+        cache.set(self._data_key(key, version), data, self.timeout)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+
+class LRUCache(object):
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+
+            expires, value = item
+            if expires <= time.time():
+                return None
+
+            self._data[key] = item
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+profile_cache = VersionedCache(
+    'portalapp:profile', getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300)
+)
@@ -0,0 +1,124 @@
+import calendar
+import hashlib
+
+from collections import OrderedDict
+
+from django.db.models import Count, DateTimeField, IntegerField, Max, OuterRef, Subquery
+from django.utils import six
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Profile, Experience, Education, Skill, Project
+
+LIST_SECTION_MODELS = (Experience, Education, Skill, Project)
+PROFILE_FIELDS = ('pk', 'updated_at', 'image_hash', 'user__updated_at', 'basic__updated_at')
+
+
+def _text(value):
+    if value is None:
+        return u''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return six.text_type(value)
+
+
+def _validators(values):
+    # Section row counts are part of the tag because deleting a row leaves
+    # every remaining updated_at untouched.
+    state = u'|'.join(_text(value) for value in values)
+    etag = quote_etag(hashlib.md5(state.encode('utf-8')).hexdigest())
+
+    timestamps = [value for value in values if hasattr(value, 'utctimetuple')]
+    last_modified = None
+    if timestamps:
+        last_modified = calendar.timegm(max(timestamps).utctimetuple())
+
+    return etag, last_modified
+
+
+def _section_aggregate(model, aggregate, output_field):
+    rows = model.objects.filter(profile_id=OuterRef('pk')).order_by().values('profile_id')
+    return Subquery(rows.annotate(value=aggregate).values('value'), output_field=output_field)
+
+
+def profile_validators(user_id):
+    # A single query over the profile row, its user and basic rows, and the
+    # latest updated_at and row count of each list section. None of the
+    # section rows are loaded.
+    annotations = OrderedDict()
+    for model in LIST_SECTION_MODELS:
+        name = model._meta.model_name
+        annotations[name + '_updated'] = _section_aggregate(model, Max('updated_at'), DateTimeField())
+        annotations[name + '_count'] = _section_aggregate(model, Count('pk'), IntegerField())
+
+    row = Profile.objects.filter(user_id=user_id).annotate(**annotations).values_list(
+        *(PROFILE_FIELDS + tuple(annotations))
+    ).first()
+    if row is None:
+        return None
+
+    # A count over no rows comes back as NULL from the subquery.
+    values = list(row)
+    for index in range(len(PROFILE_FIELDS) + 1, len(values), 2):
+        values[index] = values[index] or 0
+
+    return _validators(values)
+
+
+def loaded_profile_validators(profile):
+    # The same validators, taken from a profile loaded with
+    # ProfileQuerySet.with_sections() instead of another query.
+    basic = getattr(profile, 'basic', None)
+    values = [
+        profile.pk,
+        profile.updated_at,
+        profile.image_hash,
+        profile.user.updated_at,
+        basic.updated_at if basic is not None else None,
+    ]
+    for model in LIST_SECTION_MODELS:
+        rows = getattr(profile, model._meta.model_name + '_set').all()
+        values.append(max(row.updated_at for row in rows) if rows else None)
+        values.append(len(rows))
+
+    return _validators(values)
+
+
+def user_validators(user, profile):
+    # The /user/ body carries a token minted per request, so its tag is weak.
+    etag, last_modified = _validators([
+        user.pk, user.updated_at, profile.updated_at, profile.image_hash
+    ])
+    return 'W/' + etag, last_modified
+
+
+def _variant(validators, variant):
+    etag, last_modified = validators
+    prefix = u'W/' if etag.startswith(u'W/') else u''
+    state = etag + u'|' + variant
+    return prefix + quote_etag(hashlib.md5(state.encode('utf-8')).hexdigest()), last_modified
+
+
+def sparse_validators(validators, fields):
+    # A response pruned to `fields` is a different representation of the
+    # profile, so it gets its own tag.
+    return _variant(validators, u','.join(sorted(fields)))
+
+
+def media_type_validators(validators, media_type):
+    # Likewise the JSON and MessagePack bodies of the same state: a client
+    # holding one must not be told, with a 304, that it holds the other.
+    return _variant(validators, media_type)
+
+
+def not_modified(request, etag, last_modified):
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    # The tag depends on the negotiated renderer.
+    patch_vary_headers(response, ('Accept',))
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
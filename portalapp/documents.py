@@ -0,0 +1,79 @@
+import json
+
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .cache import profile_cache
+from .conditional import loaded_profile_validators
+from .models import Profile, ProfileDocument
+from .renderers import encode_json
+from .serializers import ProfileSerializer
+
+
+def serialize_profile(profile):
+    etag, last_modified = loaded_profile_validators(profile)
+    return ProfileDocument(
+        profile_id=profile.pk,
+        data=encode_json(ProfileSerializer(profile).data).decode('utf-8'),
+        etag=etag,
+        last_modified=last_modified,
+    )
+
+
+def load_document(data):
+    return json.loads(data, object_pairs_hook=OrderedDict)
+
+
+def build_documents(profile_ids):
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return
+
+    profiles = list(Profile.objects.with_sections().filter(pk__in=profile_ids))
+    documents = [serialize_profile(profile) for profile in profiles]
+
+    with transaction.atomic():
+        ProfileDocument.objects.filter(profile_id__in=profile_ids).delete()
+        ProfileDocument.objects.bulk_create(documents)
+
+    # A read between the write and this rebuild may have cached the old
+    # document under the bumped version, so bump again once it is current.
+    for profile in profiles:
+        profile_cache.bump(profile.user_id)
+
+
+def _chunks(chunk_size):
+    last_id = 0
+    while True:
+        profile_ids = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not profile_ids:
+            return
+
+        yield profile_ids
+        last_id = profile_ids[-1]
+
+
+def rebuild_documents(chunk_size=500):
+    count = 0
+    for profile_ids in _chunks(chunk_size):
+        build_documents(profile_ids)
+        count += len(profile_ids)
+    return count
+
+
+def verify_documents(chunk_size=500):
+    # Returns the ids of profiles whose stored document is missing or no
+    # longer matches a fresh serialization.
+    stale = []
+    for profile_ids in _chunks(chunk_size):
+        stored = dict(ProfileDocument.objects.filter(profile_id__in=profile_ids).values_list(
+            'profile_id', 'data'
+        ))
+        for profile in Profile.objects.with_sections().filter(pk__in=profile_ids):
+            expected = load_document(serialize_profile(profile).data)
+            if profile.pk not in stored or load_document(stored[profile.pk]) != expected:
+                stale.append(profile.pk)
+    return stale
@@ -0,0 +1,86 @@
+import math
+
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Profile, Experience
+
+DAYS_PER_YEAR = 365.25
+
+
+def merged_days(intervals):
+    # Days covered by the [start, end) intervals, with overlapping jobs
+    # counted once. Rows ending before they start cover nothing.
+    total = 0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += (current_end - current_start).days
+            current_start, current_end = start, end
+        elif end > current_end:
+            current_end = end
+
+    if current_end is not None:
+        total += (current_end - current_start).days
+
+    return total
+
+
+def days_range(min_years=None, max_years=None):
+    # Inclusive bounds on experience_days for a range given in years.
+    low = int(math.ceil(min_years * DAYS_PER_YEAR)) if min_years is not None else None
+    high = int(math.floor(max_years * DAYS_PER_YEAR)) if max_years is not None else None
+    return low, high
+
+
+def filter_days(queryset, low, high, field='experience_days'):
+    if low is not None:
+        queryset = queryset.filter(**{field + '__gte': low})
+    if high is not None:
+        queryset = queryset.filter(**{field + '__lte': high})
+    return queryset
+
+
+def refresh_experience(profile_ids):
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return 0
+
+    intervals = defaultdict(list)
+    for profile_id, start, end in Experience.objects.filter(profile_id__in=profile_ids).order_by().values_list(
+        'profile_id', 'start_date', 'end_date'
+    ):
+        intervals[profile_id].append((start, end))
+
+    # Only totals that moved are written, one UPDATE per distinct total, so
+    # an edit to a designation or a company costs no UPDATE. The queryset
+    # update leaves updated_at and the profile signals alone.
+    changed = defaultdict(list)
+    for pk, stored in Profile.objects.filter(pk__in=profile_ids).values_list('pk', 'experience_days'):
+        days = merged_days(intervals[pk])
+        if days != stored:
+            changed[days].append(pk)
+
+    with transaction.atomic():
+        for days, pks in changed.items():
+            Profile.objects.filter(pk__in=pks).update(experience_days=days)
+
+    return sum(len(pks) for pks in changed.values())
+
+
+def rebuild_totals(chunk_size=500):
+    count = 0
+    last_id = 0
+    while True:
+        profile_ids = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not profile_ids:
+            return count
+
+        count += refresh_experience(profile_ids)
+        last_id = profile_ids[-1]
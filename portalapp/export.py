@@ -0,0 +1,72 @@
+import csv
+import json
+
+from django.utils import six
+
+from .models import Profile
+from .renderers import ProfileListJSONRenderer, encode_json
+from .serializers import BasicSerializer, ProfileSerializer
+
+SECTION_FIELDS = ('experience', 'education', 'skills', 'projects')
+CSV_HEADER = (
+    ['username', 'bio', 'image'] +
+    ['basic_' + field for field in BasicSerializer.Meta.fields] +
+    list(SECTION_FIELDS)
+)
+
+
+class Echo(object):
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def iter_profiles(chunk_size=500):
+    # Keyset pagination over the primary key keeps every chunk an index
+    # range scan, and prefetching per chunk bounds memory to one chunk.
+    last_id = 0
+    while True:
+        chunk = list(
+            Profile.objects.with_sections().filter(pk__gt=last_id).order_by('pk')[:chunk_size]
+        )
+        if not chunk:
+            return
+
+        for profile in chunk:
+            yield ProfileSerializer(profile).data
+        last_id = chunk[-1].pk
+
+
+def iter_ndjson(chunk_size=500):
+    for data in iter_profiles(chunk_size):
+        yield encode_json(data) + b'\n'
+
+
+def iter_json(chunk_size=500):
+    return ProfileListJSONRenderer().iter_render(iter_profiles(chunk_size), chunk_size)
+
+
+def iter_csv(chunk_size=500):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    for data in iter_profiles(chunk_size):
+        basic = data['basic'] or {}
+        row = [data['username'], data['bio'], data['image']]
+        row += [basic.get(field) for field in BasicSerializer.Meta.fields]
+        row += [json.dumps(data[field]) for field in SECTION_FIELDS]
+        yield writer.writerow([_cell(value) for value in row])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'json': (iter_json, 'application/json'),
+    'csv': (iter_csv, 'text/csv'),
+}
@@ -0,0 +1,169 @@
+from collections import Counter, OrderedDict, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Basic, Profile, FacetCount, ProfileFacet
+
+FACETS = ('state', 'city', 'skill', 'company')
+MAX_VALUE_LENGTH = FacetCount._meta.get_field('value').max_length
+
+
+def profile_facets(profile):
+    # Values differing only in case count once, as the unique indexes on a
+    # case-insensitive collation would have it. The spelling kept does not
+    # depend on row order.
+    values = {}
+
+    def add(facet, value):
+        value = (value or '').strip()[:MAX_VALUE_LENGTH]
+        if value:
+            key = (facet, value.lower())
+            values[key] = min(values.get(key, value), value)
+
+    basic = getattr(profile, 'basic', None)
+    if basic is not None:
+        add('state', basic.state)
+        add('city', basic.city)
+
+    for skill in profile.skill_set.all():
+        add('skill', skill.skill)
+
+    for experience in profile.experience_set.all():
+        add('company', experience.company)
+
+    return {(facet, value) for (facet, _), value in values.items()}
+
+
+def _apply(deltas):
+    # Sorted so concurrent refreshes take the row locks in the same order.
+    for (facet, value), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+
+        counts = FacetCount.objects.filter(facet=facet, value=value)
+        if counts.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(facet=facet, value=value, count=delta)
+        except IntegrityError:
+            counts.update(count=F('count') + delta)
+
+
+def _replace_memberships(profile_ids, current):
+    stored = defaultdict(dict)
+    for pk, profile_id, facet, value in ProfileFacet.objects.filter(
+        profile_id__in=profile_ids
+    ).values_list('pk', 'profile_id', 'facet', 'value'):
+        stored[profile_id][(facet, value)] = pk
+
+    deltas = Counter()
+    removed = []
+    added = []
+    for profile_id in profile_ids:
+        old = stored[profile_id]
+        new = current.get(profile_id, set())
+        for item in set(old) - new:
+            deltas[item] -= 1
+            removed.append(old[item])
+        for item in new - set(old):
+            deltas[item] += 1
+            added.append(ProfileFacet(profile_id=profile_id, facet=item[0], value=item[1]))
+
+    ProfileFacet.objects.filter(pk__in=removed).delete()
+    ProfileFacet.objects.bulk_create(added)
+    _apply(deltas)
+
+
+def refresh_facets(profile_ids):
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return
+
+    with transaction.atomic():
+        # Locking the profiles keeps two refreshes of the same profile from
+        # diffing against the same memberships and counting twice.
+        locked = list(Profile.objects.select_for_update().filter(pk__in=profile_ids).values_list(
+            'pk', flat=True
+        ))
+        profiles = Profile.objects.filter(pk__in=locked).select_related('basic').prefetch_related(
+            'skill_set', 'experience_set'
+        )
+        _replace_memberships(profile_ids, {profile.pk: profile_facets(profile) for profile in profiles})
+
+
+def remove_profile(profile_id):
+    _replace_memberships([profile_id], {})
+
+
+def reconcile(chunk_size=500):
+    # Recomputes every membership, then rewrites any count that drifted
+    # from them. Returns the number of counts corrected.
+    last_id = 0
+    while True:
+        profile_ids = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not profile_ids:
+            break
+        refresh_facets(profile_ids)
+        last_id = profile_ids[-1]
+
+    corrected = 0
+    with transaction.atomic():
+        # The counts are locked, in the order _apply takes them, before the
+        # memberships are read. A refresh that commits first is then part
+        # of the aggregate, and one that commits later applies its delta on
+        # top of the corrected count.
+        counts = list(FacetCount.objects.select_for_update().order_by('facet', 'value').values_list(
+            'pk', 'facet', 'value', 'count'
+        ))
+        actual = {
+            (row['facet'], row['value']): row['total']
+            for row in ProfileFacet.objects.values('facet', 'value').annotate(total=Count('pk'))
+        }
+
+        for pk, facet, value, count in counts:
+            expected = actual.pop((facet, value), 0)
+            if expected != count:
+                corrected += 1
+                if expected:
+                    FacetCount.objects.filter(pk=pk).update(count=expected)
+            if not expected:
+                FacetCount.objects.filter(pk=pk).delete()
+
+        for (facet, value), count in sorted(actual.items()):
+            try:
+                with transaction.atomic():
+                    FacetCount.objects.create(facet=facet, value=value, count=count)
+            except IntegrityError:
+                # Created by a refresh since the lock was taken; it carries
+                # that refresh's own delta, and the next run checks it.
+                continue
+            corrected += 1
+
+    return corrected
+
+
+def facet_counts(limit=50):
+    # One query per facet over the rollup, whose size follows the number of
+    # distinct values rather than the number of profiles.
+    result = OrderedDict()
+    for facet in FACETS:
+        rows = FacetCount.objects.filter(facet=facet, count__gt=0).order_by('-count', 'value')
+        if facet != 'state':
+            rows = rows[:limit]
+        result[facet] = [
+            OrderedDict([('value', value), ('count', count)])
+            for value, count in rows.values_list('value', 'count')
+        ]
+
+    # Every state is listed, including those without candidates.
+    listed = {row['value'] for row in result['state']}
+    result['state'] += [
+        OrderedDict([('value', state), ('count', 0)])
+        for state, _ in Basic.STATES if state not in listed
+    ]
+
+    return result
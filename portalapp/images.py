@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import threading
+
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image
+
+from .cache import profile_cache
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIZES = getattr(settings, 'PROFILE_IMAGE_SIZES', {
+    'thumbnail': 64,
+    'small': 160,
+    'medium': 480,
+})
+IMAGE_QUALITY = getattr(settings, 'PROFILE_IMAGE_QUALITY', 85)
+IMAGE_WORKERS = getattr(settings, 'PROFILE_IMAGE_WORKERS', 2)
+DEFAULT_IMAGE = Profile._meta.get_field('image').default
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def variant_name(image_hash, size_name):
+    return 'profile-images/{}/{}-{}.jpg'.format(image_hash[:2], image_hash, size_name)
+
+
+def image_changed(profile, update_fields=None):
+    # True when a save stored an image that has not been processed: a new
+    # upload rather than the model default or the image it was loaded with.
+    if update_fields is not None and 'image' not in update_fields:
+        return False
+
+    name = profile.image.name
+    loaded = getattr(profile, '_loaded_image', None)
+    profile._loaded_image = name
+    return bool(name) and name != loaded and name != DEFAULT_IMAGE
+
+
+def image_urls(profile, original_url):
+    if not profile.image_hash:
+        return {name: original_url for name in IMAGE_SIZES}
+
+    return {
+        name: default_storage.url(variant_name(profile.image_hash, name))
+        for name in IMAGE_SIZES
+    }
+
+
+def _render_variant(source, size):
+    variant = source.copy()
+    if variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    variant.thumbnail((size, size), Image.LANCZOS)
+
+    buffer = BytesIO()
+    variant.save(buffer, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def process_profile_image(profile_id):
+    profile = Profile.objects.filter(pk=profile_id).only(
+        'user_id', 'image', 'image_hash'
+    ).first()
+    if profile is None or not profile.image or profile.image.name == DEFAULT_IMAGE:
+        return
+
+    try:
+        profile.image.open('rb')
+        try:
+            content = profile.image.read()
+        finally:
+            profile.image.close()
+        image_hash = hashlib.sha1(content).hexdigest()
+        if image_hash == profile.image_hash:
+            return
+
+        source = Image.open(BytesIO(content))
+        source.load()
+    except (IOError, OSError):
+        logger.warning('Could not read image %s for profile %s.', profile.image.name, profile_id)
+        return
+
+    for name, size in IMAGE_SIZES.items():
+        path = variant_name(image_hash, name)
+        # Content-hashed names mean an existing file is already correct.
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(_render_variant(source, size)))
+
+    # Only record the hash if the image was not replaced in the meantime.
+    updated = Profile.objects.filter(pk=profile_id, image=profile.image.name).update(
+        image_hash=image_hash
+    )
+    if updated:
+        # Imported here: signals imports this module to schedule the work.
+        from .signals import profiles_changed
+        profiles_changed([profile_id])
+        profile_cache.bump(profile.user_id)
+        if profile.image_hash:
+            remove_variants(profile.image_hash)
+
+
+def remove_variants(image_hash):
+    # Variants are shared by every profile with the same image content, so
+    # they go only once no profile refers to the hash.
+    if Profile.objects.filter(image_hash=image_hash).exists():
+        return
+
+    for name in IMAGE_SIZES:
+        default_storage.delete(variant_name(image_hash, name))
+
+
+def _process_in_worker(profile_id):
+    try:
+        process_profile_image(profile_id)
+    except Exception:
+        logger.exception('Processing the image for profile %s failed.', profile_id)
+    finally:
+        connection.close()
+
+
+def schedule_profile_image(profile_id):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(IMAGE_WORKERS)
+    _pool.apply_async(_process_in_worker, (profile_id,))
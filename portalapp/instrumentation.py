@@ -0,0 +1,157 @@
+import threading
+import time
+
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+# Upper bounds in milliseconds; anything slower lands in the last bucket.
+HISTOGRAM_BUCKETS = getattr(
+    settings, 'INSTRUMENTATION_BUCKETS', (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+
+_local = threading.local()
+
+
+class Histogram(object):
+    def __init__(self, bounds=HISTOGRAM_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return OrderedDict([
+            ('count', self.count),
+            ('sum_ms', round(self.total, 2)),
+            ('buckets', OrderedDict(zip(labels, self.counts))),
+        ])
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, timings, queries):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'timings': {}
+                }
+            stats['requests'] += 1
+            stats['queries'] += queries
+            for name, value in timings.items():
+                if name not in stats['timings']:
+                    stats['timings'][name] = Histogram()
+                stats['timings'][name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return OrderedDict(
+                (endpoint, OrderedDict([
+                    ('requests', stats['requests']),
+                    ('queries', stats['queries']),
+                    ('timings', OrderedDict(
+                        (name, histogram.as_dict())
+                        for name, histogram in sorted(stats['timings'].items())
+                    )),
+                ]))
+                for endpoint, stats in sorted(self._endpoints.items())
+            )
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = Registry()
+
+
+class Recording(object):
+    def __init__(self):
+        self.endpoint = 'unresolved'
+        self.timings = OrderedDict()
+        self.queries = 0
+        self._active = set()
+        self._connections = []
+        self._start = time.time()
+
+        # Query timings come from the debug cursor, which is only switched on
+        # for sampled requests.
+        for connection in connections.all():
+            self._connections.append((
+                connection, connection.force_debug_cursor, len(connection.queries_log)
+            ))
+            connection.force_debug_cursor = True
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds * 1000
+
+    def stop(self):
+        db_time = 0.0
+        for connection, force_debug_cursor, offset in self._connections:
+            connection.force_debug_cursor = force_debug_cursor
+            queries = list(connection.queries_log)[offset:]
+            self.queries += len(queries)
+            db_time += sum(float(query['time']) for query in queries)
+
+        self.timings['db'] = db_time * 1000
+        self.timings['total'] = (time.time() - self._start) * 1000
+
+    def server_timing(self):
+        metrics = []
+        for name, value in self.timings.items():
+            metric = '{};dur={:.2f}'.format(name, value)
+            if name == 'db':
+                metric += ';desc="{} queries"'.format(self.queries)
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+
+def start():
+    recording = _local.recording = Recording()
+    return recording
+
+
+def clear():
+    _local.recording = None
+
+
+def finish(recording):
+    _local.recording = None
+    recording.stop()
+    registry.record(recording.endpoint, recording.timings, recording.queries)
+
+
+def timed(name):
+    # Spans with the same name only count at the outermost call, so nested
+    # serializers are not added up twice.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recording = getattr(_local, 'recording', None)
+            if recording is None or name in recording._active:
+                return func(*args, **kwargs)
+
+            recording._active.add(name)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recording._active.discard(name)
+                recording.add(name, time.time() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,128 @@
+import json
+import platform
+
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_jwt.settings import api_settings
+
+from portalapp import benchmarks
+from portalapp.models import User
+
+ENDPOINTS = ('register', 'login', 'user', 'profile')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway database and drives concurrent workers through the '
+        'register, login, user and profile endpoints, reporting JSON metrics.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+        parser.add_argument('--output', help='Write the results to this file.')
+        parser.add_argument('--baseline', help='Compare against results saved with --output.')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Fail if any p95 latency grew by more than this percentage over the baseline.'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = [name for name in options['endpoints'].split(',') if name]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError('Unknown endpoints: {}'.format(', '.join(sorted(unknown))))
+
+        setup_test_environment()
+        try:
+            with benchmarks.test_database(threaded=True):
+                results = self.run(endpoints, options)
+        finally:
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                changes = benchmarks.compare(results, json.load(baseline_file))
+            self.stdout.write('Change against baseline (%):')
+            self.stdout.write(json.dumps(changes, indent=2))
+
+            limit = options['max_regression']
+            regressed = [
+                endpoint for endpoint, change in changes.items()
+                if limit is not None and change.get('p95_ms', 0) > limit
+            ]
+            if regressed:
+                raise CommandError('p95 regressed by more than {}% on: {}'.format(
+                    limit, ', '.join(regressed)
+                ))
+
+    def run(self, endpoints, options):
+        user_count = options['users']
+        benchmarks.seed_profiles(user_count)
+        users = list(User.objects.filter(username__startswith='bench').order_by('pk'))
+
+        payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+        encode_handler = api_settings.JWT_ENCODE_HANDLER
+        tokens = ['Token ' + encode_handler(payload_handler(user)) for user in users]
+        clients = {}
+
+        def client(worker):
+            # The test client keeps per-instance state, so one per worker.
+            if worker not in clients:
+                clients[worker] = APIClient()
+            return clients[worker]
+
+        def register(worker, index):
+            # RegistrationAPIView expects the JSON document as a form key.
+            body = json.dumps({
+                'email': 'load{}@example.com'.format(index),
+                'username': 'load{}'.format(index),
+                'password': 'password123',
+            })
+            return client(worker).post(
+                '/register/', body, content_type='application/x-www-form-urlencoded'
+            )
+
+        def login(worker, index):
+            user = users[index % len(users)]
+            return client(worker).post(
+                '/login/', {'email': user.email, 'password': 'password123'}, format='json'
+            )
+
+        def user(worker, index):
+            return client(worker).get('/user/', HTTP_AUTHORIZATION=tokens[index % len(tokens)])
+
+        def profile(worker, index):
+            return client(worker).get(
+                '/accounts/profile/', HTTP_AUTHORIZATION=tokens[index % len(tokens)]
+            )
+
+        senders = {'register': register, 'login': login, 'user': user, 'profile': profile}
+        results = OrderedDict([
+            ('settings', OrderedDict([
+                ('users', user_count),
+                ('requests', options['requests']),
+                ('workers', options['workers']),
+                ('database', connection.vendor),
+                ('python', platform.python_version()),
+            ])),
+            ('endpoints', OrderedDict()),
+        ])
+        for name in endpoints:
+            results['endpoints'][name] = benchmarks.run_load(
+                senders[name], options['requests'], options['workers']
+            )
+
+        return results
@@ -0,0 +1,66 @@
+import json
+import random
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import DurationField, ExpressionWrapper, F, Sum
+
+from portalapp import benchmarks
+from portalapp.experience import days_range, filter_days, rebuild_totals
+from portalapp.models import Profile
+
+
+def summed(low, high):
+    # The query-time sum the precomputed totals replace, kept as the
+    # baseline. It also counts overlapping jobs twice.
+    matches = Profile.objects.annotate(total=Sum(ExpressionWrapper(
+        F('experience__end_date') - F('experience__start_date'), output_field=DurationField()
+    )))
+    if low is not None:
+        matches = matches.filter(total__gte=timedelta(days=low))
+    if high is not None:
+        matches = matches.filter(total__lte=timedelta(days=high))
+    return list(matches.values_list('pk', flat=True)[:20])
+
+
+def indexed(low, high):
+    return list(filter_days(Profile.objects.all(), low, high).values_list('pk', flat=True)[:20])
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks years-of-experience filters on precomputed totals against a query-time sum.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=2000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        ranges = []
+        for _ in range(options['queries']):
+            low = rng.randint(0, 8)
+            ranges.append(days_range(low, low + rng.randint(1, 4)))
+
+        results = {'profiles': options['profiles'], 'queries': len(ranges)}
+        with benchmarks.test_database():
+            with benchmarks.timer(results, 'seed_seconds'):
+                benchmarks.seed_profiles(options['profiles'], seed=options['seed'])
+            with benchmarks.timer(results, 'backfill_seconds'):
+                rebuild_totals()
+
+            for name, run in (('indexed', indexed), ('summed', summed)):
+                timings = []
+                for low, high in ranges:
+                    elapsed = {}
+                    with benchmarks.timer(elapsed, 'query'):
+                        run(low, high)
+                    timings.append(elapsed['query'] * 1000)
+                results[name] = {
+                    'p50_ms': benchmarks.percentile(timings, 0.5),
+                    'p95_ms': benchmarks.percentile(timings, 0.95),
+                    'max_ms': max(timings),
+                }
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
@@ -0,0 +1,112 @@
+import json
+import random
+import timeit
+
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import msgpack
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from portalapp import benchmarks
+from portalapp.renderers import ProfileJSONRenderer, ProfileListJSONRenderer
+from portalapp.renderers import ProfileMessagePackRenderer
+
+
+def legacy_render(data):
+    # ConduitJSONRenderer.render as it was before the encoder rewrite.
+    return json.dumps({'profile': data})
+
+
+def drf_render(data):
+    return JSONRenderer().render({'profile': data})
+
+
+def make_profile(rng, sections):
+    today = date.today()
+
+    def day():
+        return (today - timedelta(days=rng.randint(0, 4000))).isoformat()
+
+    return OrderedDict([
+        ('username', 'candidate{}'.format(rng.randint(0, 10 ** 6))),
+        ('bio', u'Backend engineer \u2014 {}'.format(rng.choice(benchmarks.WORDS))),
+        ('image', '/media/mystatic/None/1.jpg'),
+        ('basic', OrderedDict([
+            ('dob', day()), ('phone', '9999999999'), ('city', rng.choice(benchmarks.CITIES)),
+            ('state', 'Karnataka'), ('country', 'India'), ('interest', 'Web Development'),
+            ('website', 'https://example.com/'),
+        ])),
+        ('experience', [OrderedDict([
+            ('designation', rng.choice(benchmarks.DESIGNATIONS)),
+            ('company', rng.choice(benchmarks.COMPANIES)),
+            ('start_date', day()), ('end_date', day()),
+        ]) for _ in range(sections)]),
+        ('education', [OrderedDict([
+            ('education_level', 'B.Tech.'), ('branch', rng.choice(benchmarks.BRANCHES)),
+            ('institute', rng.choice(benchmarks.INSTITUTES)),
+            ('start_date', day()), ('end_date', day()),
+        ]) for _ in range(sections)]),
+        ('skills', [OrderedDict([
+            ('skill', rng.choice(benchmarks.SKILLS)), ('last_used', day()),
+        ]) for _ in range(sections * 2)]),
+        ('projects', [OrderedDict([
+            ('username', 'candidate'), ('headline', rng.choice(benchmarks.WORDS)),
+            ('description', ' '.join(rng.choice(benchmarks.WORDS) for _ in range(20))),
+            ('from_date', day()), ('to_date', day()), ('ptype', 'Self'),
+            ('extra_info', 'salary 13.3 lpa'),
+        ]) for _ in range(sections)]),
+    ])
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks the profile JSON and MessagePack renderers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sections', type=int, default=10)
+        parser.add_argument('--list-size', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        repeat = options['repeat']
+        profile = make_profile(rng, options['sections'])
+        profiles = [make_profile(rng, options['sections']) for _ in range(options['list_size'])]
+
+        renderer = ProfileJSONRenderer()
+        candidates = OrderedDict([
+            ('legacy', legacy_render),
+            ('drf', drf_render),
+            ('conduit', renderer.render),
+            ('msgpack', ProfileMessagePackRenderer().render),
+        ])
+
+        results = OrderedDict()
+        for name, render in candidates.items():
+            seconds = timeit.timeit(lambda: render(profile), number=repeat)
+            results[name] = OrderedDict([
+                ('us_per_profile', round(seconds / repeat * 10 ** 6, 1)),
+                ('bytes', len(render(profile))),
+            ])
+
+        # What a client pays to parse each body.
+        decoders = OrderedDict([
+            ('conduit', json.loads),
+            ('msgpack', lambda body: msgpack.unpackb(body, raw=False)),
+        ])
+        for name, decode in decoders.items():
+            body = candidates[name](profile)
+            seconds = timeit.timeit(lambda: decode(body), number=repeat)
+            results[name]['decode_us_per_profile'] = round(seconds / repeat * 10 ** 6, 1)
+
+        list_renderer = ProfileListJSONRenderer()
+        seconds = timeit.timeit(lambda: list_renderer.render(profiles), number=3) / 3
+        results['list_render_ms'] = round(seconds * 1000, 1)
+        seconds = timeit.timeit(
+            lambda: sum(len(chunk) for chunk in list_renderer.iter_render(profiles)), number=3
+        ) / 3
+        results['list_stream_ms'] = round(seconds * 1000, 1)
+
+        self.stdout.write(json.dumps(results, indent=2))
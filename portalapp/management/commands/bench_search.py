@@ -0,0 +1,69 @@
+import json
+import random
+
+from functools import reduce
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from portalapp import benchmarks
+from portalapp.models import Profile
+from portalapp.search import rebuild_index, search, tokenize
+
+SEARCH_FIELDS = (
+    'skill__skill', 'experience__company', 'experience__designation',
+    'education__institute', 'education__branch', 'project__headline',
+    'project__description', 'basic__city',
+)
+
+
+def scan(query):
+    # The icontains scan the index replaces, kept as the baseline.
+    matches = Profile.objects.all()
+    for term in tokenize(query):
+        matches = matches.filter(reduce(
+            lambda q, field: q | Q(**{field + '__icontains': term}), SEARCH_FIELDS, Q()
+        ))
+    return list(matches.values_list('pk', flat=True).distinct()[:20])
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the search index against an icontains scan on synthetic profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=2000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        queries = [
+            ' '.join([
+                rng.choice(benchmarks.SKILLS),
+                rng.choice(benchmarks.CITIES),
+                rng.choice(benchmarks.INSTITUTES).split()[0],
+            ])
+            for _ in range(options['queries'])
+        ]
+
+        results = {'profiles': options['profiles'], 'queries': len(queries)}
+        with benchmarks.test_database():
+            with benchmarks.timer(results, 'seed_seconds'):
+                benchmarks.seed_profiles(options['profiles'], seed=options['seed'])
+            with benchmarks.timer(results, 'index_seconds'):
+                rebuild_index()
+
+            for name, run in (('index', search), ('scan', scan)):
+                timings = []
+                for query in queries:
+                    elapsed = {}
+                    with benchmarks.timer(elapsed, 'query'):
+                        run(query)
+                    timings.append(elapsed['query'] * 1000)
+                results[name] = {
+                    'p50_ms': benchmarks.percentile(timings, 0.5),
+                    'p95_ms': benchmarks.percentile(timings, 0.95),
+                    'max_ms': max(timings),
+                }
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
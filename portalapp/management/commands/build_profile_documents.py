@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from portalapp.documents import build_documents, rebuild_documents, verify_documents
+
+
+class Command(BaseCommand):
+    help = 'Backfills the denormalized profile documents, or checks them with --verify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--verify', action='store_true', help='Report stale documents.')
+        parser.add_argument('--fix', action='store_true', help='With --verify, rebuild stale documents.')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            count = rebuild_documents(chunk_size=options['chunk_size'])
+            self.stdout.write('Built {} profile documents.'.format(count))
+            return
+
+        stale = verify_documents(chunk_size=options['chunk_size'])
+        if not stale:
+            self.stdout.write('All profile documents are current.')
+            return
+
+        if options['fix']:
+            build_documents(stale)
+            self.stdout.write('Rebuilt {} stale profile documents.'.format(len(stale)))
+            return
+
+        raise CommandError('{} profile documents are stale or missing: {}'.format(
+            len(stale), ', '.join(str(pk) for pk in stale[:20])
+        ))
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from portalapp.export import EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Streams every profile with its sections as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write to. Defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        iterator, _ = EXPORT_FORMATS[options['format']]
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        try:
+            for chunk in iterator(options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portalapp.bulk import import_profiles
+
+
+class Command(BaseCommand):
+    help = 'Imports users and profile sections from a JSONL file in resumable batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--checkpoint',
+            help='Where progress is recorded. Defaults to PATH.checkpoint.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore any existing checkpoint and start from the first line.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError('{} does not exist.'.format(path))
+
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+        position = {'offset': 0, 'line': 0}
+
+        if os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint) as checkpoint_file:
+                position = json.load(checkpoint_file)
+            self.stdout.write('Resuming after line {}.'.format(position['line']))
+
+        totals = {'created': 0, 'updated': 0, 'failed': 0}
+        started = time.time()
+        imported = 0
+
+        with open(path, 'rb') as source:
+            source.seek(position['offset'])
+            batch = []
+            # readline rather than iteration so tell() stays exact.
+            for raw in iter(source.readline, b''):
+                position['line'] += 1
+                if not raw.strip():
+                    continue
+                batch.append((position['line'], raw))
+                if len(batch) == options['batch_size']:
+                    imported += self.import_batch(batch, totals)
+                    position['offset'] = source.tell()
+                    self.save_checkpoint(checkpoint, position)
+                    batch = []
+
+            if batch:
+                imported += self.import_batch(batch, totals)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write(
+            'Done: {created} created, {updated} updated, {failed} failed '
+            '({rate:.1f} rows/s).'.format(rate=imported / elapsed, **totals)
+        )
+
+    def import_batch(self, batch, totals):
+        started = time.time()
+        rows = []
+        failed = []
+        for line, raw in batch:
+            try:
+                rows.append((line, json.loads(raw.decode('utf-8'))))
+            except ValueError as exc:
+                failed.append({'key': line, 'errors': {'error': [str(exc)]}})
+
+        created, updated, import_failed = import_profiles(rows)
+        failed += import_failed
+
+        for failure in sorted(failed, key=lambda failure: failure['key']):
+            self.stderr.write('Line {}: {}'.format(failure['key'], json.dumps(failure['errors'])))
+
+        totals['created'] += len(created)
+        totals['updated'] += len(updated)
+        totals['failed'] += len(failed)
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write('Lines {}-{}: {} created, {} updated, {} failed ({:.1f} rows/s).'.format(
+            batch[0][0], batch[-1][0], len(created), len(updated), len(failed),
+            len(batch) / elapsed
+        ))
+
+        return len(batch)
+
+    def save_checkpoint(self, checkpoint, position):
+        temporary = checkpoint + '.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump(position, checkpoint_file)
+        os.rename(temporary, checkpoint)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from portalapp.experience import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every profile\'s merged experience total.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_totals(chunk_size=options['chunk_size'])
+        self.stdout.write('Updated {} profiles.'.format(count))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from portalapp.matching import rebuild_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes every profile\'s matching vector, refreshing the skill '
+        'recency weights as well.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_vectors(chunk_size=options['chunk_size'])
+        self.stdout.write('Built matching vectors for {} profiles.'.format(count))
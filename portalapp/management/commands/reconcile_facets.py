@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from portalapp.facets import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes facet memberships and corrects any facet count that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        corrected = reconcile(chunk_size=options['chunk_size'])
+        self.stdout.write('Corrected {} facet counts.'.format(corrected))
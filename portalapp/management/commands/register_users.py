@@ -0,0 +1,49 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from portalapp.bulk import register_users
+
+
+class Command(BaseCommand):
+    help = 'Registers users in bulk from a CSV file with email, username and password columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        created_count = 0
+        failed_count = 0
+
+        with open(options['path']) as csv_file:
+            reader = csv.DictReader(csv_file)
+            # Header is line 1, so the first data row is line 2.
+            line = 2
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    created, failed = self.register_batch(batch, line)
+                    created_count += created
+                    failed_count += failed
+                    line += len(batch)
+                    batch = []
+
+            if batch:
+                created, failed = self.register_batch(batch, line)
+                created_count += created
+                failed_count += failed
+
+        self.stdout.write('Registered {} users, {} rows failed.'.format(
+            created_count, failed_count
+        ))
+
+    def register_batch(self, batch, first_line):
+        created, failed = register_users(batch)
+        for failure in failed:
+            self.stderr.write('Line {}: {}'.format(
+                first_line + failure['index'], dict(failure['errors'])
+            ))
+        return len(created), len(failed)
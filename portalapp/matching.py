@@ -0,0 +1,281 @@
+import json
+import math
+import threading
+
+from datetime import date, timedelta
+
+import numpy as np
+import scipy.sparse as sp
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Profile, MatchVector
+
+# A skill last used this many years ago counts half as much as a current one.
+SKILL_HALF_LIFE_YEARS = getattr(settings, 'MATCHING_SKILL_HALF_LIFE_YEARS', 2.0)
+EXPERIENCE_WEIGHT = getattr(settings, 'MATCHING_EXPERIENCE_WEIGHT', 0.5)
+EDUCATION_WEIGHT = getattr(settings, 'MATCHING_EDUCATION_WEIGHT', 0.3)
+# Changed rows collect in a small delta matrix that is merged into the
+# main one once it grows past this fraction of it.
+COMPACT_RATIO = getattr(settings, 'MATCHING_COMPACT_RATIO', 0.1)
+COMPACT_MIN_ROWS = 256
+# A vector becomes visible when its transaction commits, which can be
+# after later-written ones; each sync re-reads this much before the newest
+# row it has seen. It also absorbs clock skew between the writers.
+SYNC_LAG = timedelta(seconds=getattr(settings, 'MATCHING_SYNC_LAG_SECONDS', 60))
+
+
+def _feature(kind, value):
+    value = (value or '').strip().lower()
+    return u'{}:{}'.format(kind, value) if value else None
+
+
+def _normalize(features):
+    norm = math.sqrt(sum(weight * weight for weight in features.values()))
+    if not norm:
+        return {}
+    return {name: weight / norm for name, weight in features.items()}
+
+
+def skill_weight(last_used, today):
+    years = max((today - last_used).days, 0) / 365.0
+    return 0.5 ** (years / SKILL_HALF_LIFE_YEARS)
+
+
+def profile_features(profile, today=None):
+    today = today or date.today()
+    features = {}
+
+    def add(name, weight):
+        if name is not None:
+            features[name] = max(features.get(name, 0.0), weight)
+
+    for skill in profile.skill_set.all():
+        add(_feature('skill', skill.skill), skill_weight(skill.last_used, today))
+
+    for experience in profile.experience_set.all():
+        add(_feature('company', experience.company), EXPERIENCE_WEIGHT)
+        add(_feature('designation', experience.designation), EXPERIENCE_WEIGHT)
+
+    for education in profile.education_set.all():
+        add(_feature('institute', education.institute), EDUCATION_WEIGHT)
+        add(_feature('branch', education.branch), EDUCATION_WEIGHT)
+        add(_feature('level', education.education_level), EDUCATION_WEIGHT)
+
+    return _normalize(features)
+
+
+def skill_features(skills):
+    return _normalize({
+        name: 1.0 for name in (_feature('skill', skill) for skill in skills) if name
+    })
+
+
+def index_profiles(profile_ids):
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return
+
+    today = date.today()
+    vectors = [
+        MatchVector(profile_id=profile.pk, features=json.dumps(profile_features(profile, today)))
+        for profile in Profile.objects.filter(pk__in=profile_ids).prefetch_related(
+            'skill_set', 'experience_set', 'education_set'
+        )
+    ]
+
+    with transaction.atomic():
+        MatchVector.objects.filter(profile_id__in=profile_ids).delete()
+        MatchVector.objects.bulk_create(vectors)
+
+
+def rebuild_vectors(chunk_size=500):
+    count = 0
+    last_id = 0
+    while True:
+        profile_ids = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not profile_ids:
+            return count
+
+        index_profiles(profile_ids)
+        count += len(profile_ids)
+        last_id = profile_ids[-1]
+
+
+class MatchingIndex(object):
+    # Rows of L2-normalised vectors, so a dot product is the cosine. A
+    # changed profile masks its old row and appends the new one to `delta`;
+    # queries score both matrices, and compaction folds the delta back in.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.columns = {}
+        self.watermark = None
+        # profile id -> id of the MatchVector row its vector came from.
+        self.applied = {}
+        self.main = sp.csr_matrix((0, 0))
+        self.main_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.delta = []
+        self._delta_matrix = None
+        self.positions = {}
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = len(self.columns)
+        return column
+
+    def _drop(self, profile_id):
+        self.applied.pop(profile_id, None)
+        position = self.positions.pop(profile_id, None)
+        if position is not None:
+            kind, index = position
+            if kind == 'main':
+                self.alive[index] = False
+            else:
+                self.delta[index] = None
+                self._delta_matrix = None
+
+    def _put(self, profile_id, features):
+        self._drop(profile_id)
+
+        row = {self._column(name): weight for name, weight in features.items()}
+        self.positions[profile_id] = ('delta', len(self.delta))
+        self.delta.append((profile_id, row))
+        self._delta_matrix = None
+
+    def _rows_matrix(self, rows):
+        indptr = [0]
+        indices = []
+        data = []
+        for _, row in rows:
+            indices.extend(row.keys())
+            data.extend(row.values())
+            indptr.append(len(indices))
+        return sp.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), indptr),
+            shape=(len(rows), len(self.columns))
+        )
+
+    def _resized(self, matrix):
+        return sp.csr_matrix(
+            (matrix.data, matrix.indices, matrix.indptr),
+            shape=(matrix.shape[0], len(self.columns))
+        )
+
+    def _delta_rows(self):
+        return [item for item in self.delta if item is not None]
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive)
+        delta = self._delta_rows()
+        self.main = sp.vstack([
+            self._resized(self.main[keep]), self._rows_matrix(delta)
+        ], format='csr')
+        self.main_ids = np.concatenate([
+            self.main_ids[keep], np.array([pk for pk, _ in delta], dtype=np.int64)
+        ])
+        self.alive = np.ones(len(self.main_ids), dtype=bool)
+        self.positions = {pk: ('main', index) for index, pk in enumerate(self.main_ids.tolist())}
+        self.delta = []
+        self._delta_matrix = None
+
+    def sync(self):
+        rows = MatchVector.objects.all()
+        if self.watermark is not None:
+            rows = rows.filter(written_at__gte=self.watermark - SYNC_LAG)
+        rows = rows.order_by('written_at', 'pk').values_list('pk', 'profile_id', 'features', 'written_at')
+
+        for pk, profile_id, features, written_at in rows.iterator():
+            # Rows inside the lag window come back on every sync; only a
+            # replaced vector is applied again.
+            if self.applied.get(profile_id) != pk:
+                self._put(profile_id, json.loads(features))
+                self.applied[profile_id] = pk
+            if self.watermark is None or written_at > self.watermark:
+                self.watermark = written_at
+
+        if len(self.delta) > max(COMPACT_MIN_ROWS, COMPACT_RATIO * len(self.main_ids)):
+            self._compact()
+
+    def _vector(self, features):
+        vector = np.zeros(len(self.columns))
+        for name, weight in features.items():
+            column = self.columns.get(name)
+            if column is not None:
+                vector[column] = weight
+        return vector
+
+    def _profile_vector(self, profile_id):
+        position = self.positions.get(profile_id)
+        if position is None:
+            return None
+
+        kind, index = position
+        vector = np.zeros(len(self.columns))
+        if kind == 'main':
+            row = self.main.getrow(index)
+            vector[row.indices] = row.data
+        else:
+            for column, weight in self.delta[index][1].items():
+                vector[column] = weight
+        return vector
+
+    def _top(self, vector, limit, exclude=None):
+        scores = [self.main.dot(vector[:self.main.shape[1]]) if self.main.shape[0] else np.zeros(0)]
+        scores[0][~self.alive] = 0.0
+        ids = [self.main_ids]
+
+        delta = self._delta_rows()
+        if delta:
+            if self._delta_matrix is None:
+                self._delta_matrix = self._rows_matrix(delta)
+            scores.append(self._delta_matrix.dot(vector[:self._delta_matrix.shape[1]]))
+            ids.append(np.array([pk for pk, _ in delta], dtype=np.int64))
+
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+        if exclude is not None:
+            scores[ids == exclude] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = sorted(
+            ((int(ids[index]), float(scores[index])) for index in candidates),
+            key=lambda item: (-item[1], item[0])
+        )
+        return ranked
+
+    def _live_top(self, vector, limit, exclude=None):
+        # Deleted profiles take their vectors with them without leaving
+        # anything for sync to read, so the ranked ids are checked against
+        # the table and the gone ones masked before ranking again.
+        while True:
+            ranked = self._top(vector, limit, exclude=exclude)
+            ids = [pk for pk, _ in ranked]
+            live = set(MatchVector.objects.filter(profile_id__in=ids).values_list('profile_id', flat=True))
+            gone = [pk for pk in ids if pk not in live]
+            if not gone:
+                return ranked
+            for pk in gone:
+                self._drop(pk)
+
+    def similar(self, profile_id, limit=10):
+        with self._lock:
+            self.sync()
+            vector = self._profile_vector(profile_id)
+            if vector is None:
+                return []
+            return self._live_top(vector, limit, exclude=profile_id)
+
+    def match(self, features, limit=10):
+        with self._lock:
+            self.sync()
+            return self._live_top(self._vector(features), limit)
+
+
+matching_index = MatchingIndex()
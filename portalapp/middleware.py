@@ -0,0 +1,81 @@
+import random
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from . import instrumentation, routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    # Sampled requests get a Server-Timing header and feed the per-endpoint
+    # histograms; the rest only pay for one random() call.
+    def process_request(self, request):
+        rate = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.0)
+        if rate > 0 and random.random() < rate:
+            request._instrumentation = instrumentation.start()
+        else:
+            request._instrumentation = None
+            instrumentation.clear()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recording = getattr(request, '_instrumentation', None)
+        if recording is not None:
+            recording.endpoint = getattr(view_func, '__name__', recording.endpoint)
+
+    def process_exception(self, request, exception):
+        recording = getattr(request, '_instrumentation', None)
+        if recording is not None:
+            request._instrumentation = None
+            instrumentation.finish(recording)
+
+    def process_response(self, request, response):
+        recording = getattr(request, '_instrumentation', None)
+        if recording is None:
+            return response
+
+        request._instrumentation = None
+        instrumentation.finish(recording)
+        response['Server-Timing'] = recording.server_timing()
+
+        return response
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    # Safe requests to views with `replica_reads = True` read from
+    # DATABASE_REPLICAS. A client that wrote within the last
+    # REPLICA_STICKY_SECONDS, identified by its Authorization header or
+    # session cookie, keeps reading from the primary so it sees its writes;
+    # so does the user it wrote as, once authentication finds it.
+    def client(self, request):
+        return request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(
+            settings.SESSION_COOKIE_NAME
+        )
+
+    def process_request(self, request):
+        routers.reset()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method not in SAFE_METHODS or not getattr(view_class, 'replica_reads', False):
+            return None
+
+        client = self.client(request)
+        if client is None or not routers.is_pinned(client):
+            routers.use_replicas()
+
+    def process_response(self, request, response):
+        if routers.wrote():
+            client = self.client(request)
+            if client is not None:
+                routers.pin(client)
+            session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+            if session is not None and session.value:
+                routers.pin(session.value)
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                routers.pin_user(user.pk)
+        routers.reset()
+
+        return response
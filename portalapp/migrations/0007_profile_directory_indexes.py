@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portalapp', '0006_auto_20180822_1140'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_p_created_60f88b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='basic',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_b_created_e86565_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='basic',
+            index=models.Index(fields=[b'state', b'city'], name='portalapp_b_state_1e384f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='basic',
+            index=models.Index(fields=[b'city'], name='portalapp_b_city_6e9bcf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='education',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_e_created_d7753f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_s_created_f7ed55_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=[b'skill', b'profile'], name='portalapp_s_skill_25af49_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_p_created_fec632_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='experience',
+            index=models.Index(fields=[b'-created_at', b'-updated_at'], name='portalapp_e_created_2c772d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='experience',
+            index=models.Index(fields=[b'company', b'profile'], name='portalapp_e_company_755bd5_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portalapp', '0010_profile_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchVector',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('features', models.TextField()),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='portalapp.Profile')),
+            ],
+        ),
+    ]
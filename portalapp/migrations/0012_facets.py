@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portalapp', '0011_match_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=16)),
+                ('value', models.CharField(max_length=150)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProfileFacet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=16)),
+                ('value', models.CharField(max_length=150)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='portalapp.Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='facetcount',
+            index=models.Index(fields=[b'facet', b'-count'], name='portalapp_f_facet_4b10c3_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together=set([('facet', 'value')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='profilefacet',
+            unique_together=set([('profile', 'facet', 'value')]),
+        ),
+    ]
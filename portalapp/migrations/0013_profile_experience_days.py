@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portalapp', '0012_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='experience_days',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def create_stats(apps, schema_editor):
+    SearchDocument = apps.get_model('portalapp', 'SearchDocument')
+    SearchStats = apps.get_model('portalapp', 'SearchStats')
+    totals = SearchDocument.objects.aggregate(documents=Count('pk'), total_length=Sum('length'))
+    SearchStats.objects.create(
+        pk=1, documents=totals['documents'], total_length=totals['total_length'] or 0
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portalapp', '0013_profile_experience_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('documents', models.PositiveIntegerField(default=0)),
+                ('total_length', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_stats, migrations.RunPython.noop),
+    ]
@@ -37,6 +37,27 @@ class UserManager(BaseUserManager):
         return user
 
 
+class ProfileQuerySet(models.QuerySet):
+    # ProfileSerializer field name -> the relation it is read from.
+    LIST_SECTIONS = (
+        ('experience', 'experience_set'),
+        ('education', 'education_set'),
+        ('skills', 'skill_set'),
+        ('projects', 'project_set'),
+    )
+
+    def with_sections(self, fields=None):
+        # `fields` limits the sections loaded to the serializer fields that
+        # will be output; None loads them all.
+        related = ['user']
+        if fields is None or 'basic' in fields:
+            related.append('basic')
+
+        return self.select_related(*related).prefetch_related(*[
+            lookup for name, lookup in self.LIST_SECTIONS if fields is None or name in fields
+        ])
+
+
 class TimestampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -44,6 +65,7 @@ class TimestampedModel(models.Model):
     class Meta:
         abstract = True
         ordering = ['-created_at', '-updated_at']
+        indexes = [models.Index(fields=['-created_at', '-updated_at'])]
 
 
 class User(AbstractBaseUser, PermissionsMixin, TimestampedModel):
@@ -86,6 +108,20 @@ class Profile(TimestampedModel):
     )
     bio = models.TextField(blank=True)
     image = models.ImageField(upload_to='mystatic/', default="mystatic/None/1.jpg", max_length=255)
+    image_hash = models.CharField(max_length=40, blank=True, editable=False)
+    # Days covered by the experience rows, overlaps merged. Maintained by
+    # portalapp.experience for range filters on years of experience.
+    experience_days = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+
+    objects = ProfileQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Profile, cls).from_db(db, field_names, values)
+        # The image as loaded, so a save that keeps it is not reprocessed.
+        if 'image' in field_names:
+            instance._loaded_image = values[field_names.index('image')]
+        return instance
 
     def __str__(self):
         return self.user.username
@@ -142,6 +178,12 @@ class Basic(TimestampedModel):
     interest = models.CharField(max_length=200, default="Web Development")
     website = models.CharField(max_length=200, default="https://bbc.com/")
 
+    class Meta(TimestampedModel.Meta):
+        indexes = TimestampedModel.Meta.indexes + [
+            models.Index(fields=['state', 'city']),
+            models.Index(fields=['city']),
+        ]
+
 
 class Experience(TimestampedModel):
     profile = models.ForeignKey('portalapp.Profile', on_delete=models.CASCADE)
@@ -150,6 +192,11 @@ class Experience(TimestampedModel):
     start_date = models.DateField(default=timezone.now)
     end_date = models.DateField(default=timezone.now)
 
+    class Meta(TimestampedModel.Meta):
+        indexes = TimestampedModel.Meta.indexes + [
+            models.Index(fields=['company', 'profile']),
+        ]
+
 
 class Education(TimestampedModel):
     profile = models.ForeignKey('portalapp.Profile', on_delete=models.CASCADE)
@@ -165,6 +212,11 @@ class Skill(TimestampedModel):
     skill = models.CharField(max_length=150, default="Java")
     last_used = models.DateField(default=timezone.now)
 
+    class Meta(TimestampedModel.Meta):
+        indexes = TimestampedModel.Meta.indexes + [
+            models.Index(fields=['skill', 'profile']),
+        ]
+
 
 class Project(TimestampedModel):
     PROJECT_TYPE = (
@@ -178,3 +230,67 @@ class Project(TimestampedModel):
     to_date = models.DateField(default=timezone.now)
     ptype = models.CharField(max_length=50, choices=PROJECT_TYPE, default="Self")
     extra_info = models.TextField(max_length=100, default="salary 13.3 lpa")
+
+
+class SearchDocument(models.Model):
+    profile = models.OneToOneField(
+        'portalapp.Profile', on_delete=models.CASCADE, primary_key=True
+    )
+    length = models.PositiveIntegerField(default=0)
+
+
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey('portalapp.SearchDocument', on_delete=models.CASCADE)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('term', 'document')
+
+
+class SearchStats(models.Model):
+    # The single row (pk 1) holding the document count and total length
+    # BM25 needs, kept current by portalapp.search as documents change.
+    documents = models.PositiveIntegerField(default=0)
+    total_length = models.BigIntegerField(default=0)
+
+
+class ProfileDocument(models.Model):
+    # ProfileSerializer output for the profile, rebuilt whenever the profile
+    # or any of its sections changes, with the validators it was served with.
+    profile = models.OneToOneField(
+        'portalapp.Profile', on_delete=models.CASCADE, primary_key=True
+    )
+    data = models.TextField()
+    etag = models.CharField(max_length=40)
+    last_modified = models.BigIntegerField(null=True)
+
+
+class MatchVector(models.Model):
+    # The normalised feature weights of a profile as JSON. A rebuild
+    # replaces the row, and in-process indexes catch up by reading the rows
+    # written since the last one they have seen.
+    profile = models.OneToOneField('portalapp.Profile', on_delete=models.CASCADE)
+    features = models.TextField()
+    written_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+class FacetCount(models.Model):
+    # Number of profiles per facet value, kept up to date by
+    # portalapp.facets from the ProfileFacet memberships below.
+    facet = models.CharField(max_length=16)
+    value = models.CharField(max_length=150)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+        indexes = [models.Index(fields=['facet', '-count'])]
+
+
+class ProfileFacet(models.Model):
+    profile = models.ForeignKey('portalapp.Profile', on_delete=models.CASCADE)
+    facet = models.CharField(max_length=16)
+    value = models.CharField(max_length=150)
+
+    class Meta:
+        unique_together = ('profile', 'facet', 'value')
@@ -1,33 +1,193 @@
+import datetime
+import decimal
 import json
+import uuid
 
-from rest_framework.renderers import JSONRenderer
+import msgpack
+
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .instrumentation import timed
+
+
+def _encode_datetime(value):
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def _encode_text(value):
+    return force_text(value)
+
+
+# Looked up by exact type first so the common cases skip the isinstance chain.
+TYPE_ENCODERS = (
+    (datetime.datetime, _encode_datetime),
+    (datetime.date, lambda value: value.isoformat()),
+    (datetime.time, lambda value: value.isoformat()),
+    (decimal.Decimal, float),
+    (uuid.UUID, six.text_type),
+    (six.binary_type, lambda value: value.decode('utf-8')),
+    (Promise, _encode_text),
+)
+TYPE_ENCODER_MAP = dict(TYPE_ENCODERS)
+
+
+def encode_value(obj):
+    encoder = TYPE_ENCODER_MAP.get(type(obj))
+    if encoder is None:
+        for cls, candidate in TYPE_ENCODERS:
+            if isinstance(obj, cls):
+                encoder = candidate
+                break
+        else:
+            raise TypeError('{!r} is not serializable'.format(obj))
+    return encoder(obj)
+
+
+class ConduitJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        return encode_value(obj)
+
+
+# ASCII output keeps string escaping inside the C accelerator; with
+# ensure_ascii=False Python 2 escapes every string in pure Python.
+_encoder = ConduitJSONEncoder(separators=(',', ':'))
+
+
+def encode_json(data):
+    content = _encoder.encode(data)
+    if isinstance(content, six.text_type):
+        content = content.encode('utf-8')
+    return content
+
+
+def encode_msgpack(data):
+    # Without the bin type, bytes are sent as strings, as the JSON path
+    # decodes them; Python 2 str values need that too.
+    return msgpack.packb(data, default=encode_value, use_bin_type=False)
 
 
 class ConduitJSONRenderer(JSONRenderer):
     charset = 'utf-8'
     object_label = 'object'
 
+    @timed('render')
     def render(self, data, media_type=None, renderer_context=None):
-        errors = data.get('errors', None)
+        # No body at all, as JSONRenderer does, rather than an empty envelope.
+        if data is None:
+            return b''
+
+        errors = data.get('errors', None) if isinstance(data, dict) else None
 
         if errors is not None:
             return super(ConduitJSONRenderer, self).render(data)
 
-        return json.dumps({
+        return encode_json({
             self.object_label: data
         })
 
+    def iter_render(self, items, chunk_size=100):
+        # Streams `{"<object_label>": [item, ...]}` a chunk of items at a
+        # time, for responses too large to build in memory.
+        yield b'{' + encode_json(self.object_label) + b':['
+        separator = b''
+        chunk = []
+        for item in items:
+            chunk.append(encode_json(item))
+            if len(chunk) == chunk_size:
+                yield separator + b','.join(chunk)
+                separator = b','
+                chunk = []
+
+        if chunk:
+            yield separator + b','.join(chunk)
+        yield b']}'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return encode_msgpack(data)
+
+
+class ConduitMessagePackRenderer(MessagePackRenderer):
+    # ConduitJSONRenderer's envelope and error shape, for clients that send
+    # Accept: application/msgpack.
+    object_label = 'object'
+
+    @timed('render')
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        errors = data.get('errors', None) if isinstance(data, dict) else None
+
+        if errors is not None:
+            return encode_msgpack(data)
+
+        return encode_msgpack({
+            self.object_label: data
+        })
+
+
 class ProfileJSONRenderer(ConduitJSONRenderer):
     object_label = 'profile'
 
 
+class ProfileListJSONRenderer(ConduitJSONRenderer):
+    object_label = 'profiles'
+
+
+class RegistrationBatchJSONRenderer(ConduitJSONRenderer):
+    object_label = 'registrations'
+
+
+class MetricsJSONRenderer(ConduitJSONRenderer):
+    object_label = 'metrics'
+
+
+class FacetsJSONRenderer(ConduitJSONRenderer):
+    object_label = 'facets'
+
+
 class UserJSONRenderer(ConduitJSONRenderer):
+    # Tokens that are still bytes are decoded by the encoder, so the payload
+    # no longer needs patching before it is rendered.
     charset = 'utf-8'
     object_label = 'user'
 
-    def render(self, data, media_type=None, renderer_context=None):
-        token = data.get('token', None)
 
-        if token is not None and isinstance(token, bytes):
-            data['token'] = token.decode('utf-8')
-        return super(UserJSONRenderer, self).render(data)
+class ProfileMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'profile'
+
+
+class ProfileListMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'profiles'
+
+
+class RegistrationBatchMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'registrations'
+
+
+class MetricsMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'metrics'
+
+
+class FacetsMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'facets'
+
+
+class UserMessagePackRenderer(ConduitMessagePackRenderer):
+    object_label = 'user'
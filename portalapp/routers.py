@@ -0,0 +1,75 @@
+import hashlib
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def reset():
+    _state.use_replicas = False
+    _state.wrote = False
+
+
+def use_replicas():
+    _state.use_replicas = True
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def reading_replicas():
+    # True while reads go to a replica. What is read then may lag the
+    # primary, so it must not be stored in caches other requests trust.
+    return getattr(_state, 'use_replicas', False) and not wrote() and bool(replica_aliases())
+
+
+def _pin_key(client):
+    return 'portalapp:replica-pin:{}'.format(hashlib.sha1(client.encode('utf-8')).hexdigest())
+
+
+def pin(client):
+    cache.set(_pin_key(client), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def is_pinned(client):
+    return cache.get(_pin_key(client)) is not None
+
+
+def pin_user(user_id):
+    pin(u'user:{}'.format(user_id))
+
+
+def read_primary_for(user_id):
+    # A write can hand the client credentials it did not send with it (a
+    # registration's token, a login's session), so once a request's user is
+    # known, a pin on that user moves its remaining reads to the primary.
+    if reading_replicas() and is_pinned(u'user:{}'.format(user_id)):
+        _state.use_replicas = False
+
+
+class ReplicaRouter(object):
+    # Reads go to a replica only while a request that opted in through
+    # ReplicaRoutingMiddleware is running, and only until it writes;
+    # everything else (commands, tasks, writes) uses the primary.
+    def db_for_read(self, model, **hints):
+        if reading_replicas():
+            return random.choice(replica_aliases())
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
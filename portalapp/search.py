@@ -0,0 +1,181 @@
+import math
+import re
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+
+from .experience import filter_days
+from .models import Profile, SearchDocument, SearchPosting, SearchStats
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# Okapi BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+STATS_ID = 1
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1
+    ]
+
+
+def profile_text(profile):
+    parts = [profile.user.username]
+
+    basic = getattr(profile, 'basic', None)
+    if basic is not None:
+        parts += [basic.city, basic.state]
+
+    for experience in profile.experience_set.all():
+        parts += [experience.company, experience.designation]
+
+    for education in profile.education_set.all():
+        parts += [education.institute, education.branch, education.education_level]
+
+    for skill in profile.skill_set.all():
+        parts.append(skill.skill)
+
+    for project in profile.project_set.all():
+        parts += [project.headline, project.description]
+
+    return ' '.join(parts)
+
+
+def index_profiles(profile_ids):
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return
+
+    profiles = Profile.objects.with_sections().filter(pk__in=profile_ids)
+    documents = []
+    postings = []
+    for profile in profiles:
+        terms = Counter(tokenize(profile_text(profile)))
+        document = SearchDocument(profile_id=profile.pk, length=sum(terms.values()))
+        documents.append(document)
+        postings += [
+            SearchPosting(term=term, document=document, frequency=frequency)
+            for term, frequency in terms.items()
+        ]
+
+    with transaction.atomic():
+        _lock_profiles(profile_ids)
+        removed = _remove_documents(profile_ids)
+        SearchDocument.objects.bulk_create(documents)
+        SearchPosting.objects.bulk_create(postings)
+        _adjust_stats(
+            len(documents) - removed['documents'],
+            sum(document.length for document in documents) - removed['length'],
+        )
+
+
+def remove_profile(profile_id):
+    with transaction.atomic():
+        _lock_profiles([profile_id])
+        removed = _remove_documents([profile_id])
+        _adjust_stats(-removed['documents'], -removed['length'])
+
+
+def _lock_profiles(profile_ids):
+    # Writes for the same profiles queue on their rows, so each adjusts the
+    # stats by the documents it actually replaced; writes for other profiles
+    # go ahead. The stats row itself is only changed by F() deltas at the
+    # end of the transaction, and rebuild_index recounts it.
+    list(Profile.objects.select_for_update().filter(pk__in=profile_ids).order_by('pk').values_list(
+        'pk', flat=True
+    ))
+
+
+def _remove_documents(profile_ids):
+    documents = SearchDocument.objects.filter(profile_id__in=profile_ids)
+    removed = documents.aggregate(documents=Count('pk'), length=Sum('length'))
+    documents.delete()
+    return {'documents': removed['documents'], 'length': removed['length'] or 0}
+
+
+def _adjust_stats(documents, length):
+    if not documents and not length:
+        return
+
+    updated = SearchStats.objects.filter(pk=STATS_ID).update(
+        documents=F('documents') + documents, total_length=F('total_length') + length
+    )
+    if not updated:
+        reset_stats()
+
+
+def reset_stats():
+    totals = SearchDocument.objects.aggregate(documents=Count('pk'), length=Sum('length'))
+    SearchStats.objects.update_or_create(pk=STATS_ID, defaults={
+        'documents': totals['documents'], 'total_length': totals['length'] or 0,
+    })
+
+
+def rebuild_index(chunk_size=500):
+    count = 0
+    last_id = 0
+    while True:
+        profile_ids = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not profile_ids:
+            reset_stats()
+            return count
+
+        index_profiles(profile_ids)
+        count += len(profile_ids)
+        last_id = profile_ids[-1]
+
+
+def search(query, limit=20, offset=0, min_days=None, max_days=None):
+    terms = set(tokenize(query))
+    if not terms or limit <= 0:
+        return 0, []
+
+    stats = SearchStats.objects.filter(pk=STATS_ID).values_list('documents', 'total_length').first()
+    if not stats or not stats[0]:
+        return 0, []
+    total, total_length = stats
+    average_length = float(total_length) / total or 1.0
+
+    # Term statistics stay collection-wide; the experience range only
+    # decides which documents are scored.
+    document_frequency = dict(SearchPosting.objects.filter(term__in=terms).values('term').annotate(
+        df=Count('pk')
+    ).order_by().values_list('term', 'df'))
+    if not document_frequency:
+        return 0, []
+
+    idf = {
+        term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for term, df in document_frequency.items()
+    }
+
+    # BM25 is summed per document and the page is cut in SQL, so only the
+    # rows returned leave the database.
+    weight = Case(*[
+        When(term=term, then=Value(value)) for term, value in idf.items()
+    ], output_field=FloatField())
+    norm = Value(K1 * (1 - B)) + Value(K1 * B / average_length) * F('document__length')
+    score = ExpressionWrapper(
+        weight * F('frequency') * Value(K1 + 1) / (F('frequency') + norm), output_field=FloatField()
+    )
+
+    postings = filter_days(
+        SearchPosting.objects.filter(term__in=idf), min_days, max_days,
+        field='document__profile__experience_days'
+    )
+    count = postings.values('document_id').distinct().count()
+    ranked = postings.values('document_id').annotate(score=Sum(score)).order_by(
+        '-score', 'document_id'
+    ).values_list('document_id', 'score')[offset:offset + limit]
+
+    return count, list(ranked)
@@ -1,8 +1,12 @@
+from collections import OrderedDict
+
 from rest_framework import serializers
 
 from .models import User
 from .models import Profile, Basic, Experience, Education, Skill, Project
 from django.contrib.auth import authenticate
+from .images import image_urls
+from .instrumentation import timed
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -21,6 +25,25 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
+class BulkRegistrationSerializer(RegistrationSerializer):
+    # Uniqueness is checked once for the whole batch instead of per row.
+    class Meta(RegistrationSerializer.Meta):
+        extra_kwargs = {
+            'email': {'validators': []},
+            'username': {'validators': []},
+        }
+
+
+class ImportUserSerializer(BulkRegistrationSerializer):
+    # Accounts migrated without a password get an unusable one.
+    password = serializers.CharField(
+        max_length=128,
+        min_length=8,
+        write_only=True,
+        required=False
+    )
+
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.CharField(max_length=255)
     username = serializers.CharField(max_length=255, read_only=True)
@@ -58,7 +81,7 @@ class LoginSerializer(serializers.Serializer):
 
 
 class ProjectSerializer(serializers.ModelSerializer):
-    username = serializers.CharField(source='profile.user.username')
+    username = serializers.CharField(source='profile.user.username', read_only=True)
     class Meta:
         model = Project
         fields = ('username', 'headline', 'description', 'from_date', 'to_date', 'ptype', 'extra_info')
@@ -91,22 +114,76 @@ class ProfileSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username')
     bio = serializers.CharField(allow_blank=True, required=False)
     image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
     basic = BasicSerializer(read_only=True)
     experience = ExperienceSerializer(source='experience_set', many=True, default=[])
     education = EducationSerializer(source='education_set', many=True, default=[])
     skills = SkillSerializer(source='skill_set', many=True, default=[])
     projects = ProjectSerializer(source='project_set', many=True, default=[])
 
+    SECTIONS = ('basic', 'experience', 'education', 'skills', 'projects')
+
     class Meta:
         model = Profile
-        fields = ('username', 'bio', 'image','basic', 'experience', 'education', 'skills', 'projects')
+        fields = ('username', 'bio', 'image', 'images', 'basic', 'experience', 'education', 'skills', 'projects')
         read_only_fields = ('username',)
 
+    def __init__(self, *args, **kwargs):
+        # `fields` keeps only the named top-level fields; see profile_fields.
+        fields = kwargs.pop('fields', None)
+        super(ProfileSerializer, self).__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def get_image(self, obj):
         if obj.image:
             return obj.image.url
         return 'https://static.productionready.io/images/smiley-cyrus.jpg' #TODO
 
+    def get_images(self, obj):
+        return image_urls(obj, self.get_image(obj))
+
+    @timed('serialize')
+    def to_representation(self, instance):
+        return super(ProfileSerializer, self).to_representation(instance)
+
+
+def profile_fields(params):
+    # ?fields= names the top-level profile fields to return and ?include=
+    # adds sections to them, or to the non-section fields when ?fields= is
+    # absent. Without either every field is returned and None is given.
+    def names(key):
+        return [name.strip() for name in params.get(key, '').split(',') if name.strip()]
+
+    fields, include = names('fields'), names('include')
+    if not fields and not include:
+        return None
+
+    known = ProfileSerializer.Meta.fields
+    unknown = sorted(set(fields + include) - set(known))
+    if unknown:
+        raise serializers.ValidationError({
+            'fields': ['Unknown fields: {}.'.format(', '.join(unknown))]
+        })
+
+    if not fields:
+        fields = [name for name in known if name not in ProfileSerializer.SECTIONS]
+
+    return frozenset(fields + include)
+
+
+def sparse_data(data, fields):
+    # Prunes an already serialized profile (a cached response or a
+    # ProfileDocument) to `fields`, in the serializer's field order.
+    if fields is None:
+        return data
+
+    return OrderedDict(
+        (name, data[name]) for name in ProfileSerializer.Meta.fields if name in fields and name in data
+    )
+
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -123,21 +200,36 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('email', 'username', 'password', 'token', 'profile', 'bio', 'image')
         read_only_fields = ('token',)
 
+    def get_image(self, obj):
+        return ProfileSerializer().get_image(obj.profile)
+
+    @timed('serialize')
+    def to_representation(self, instance):
+        return super(UserSerializer, self).to_representation(instance)
+
     def update(self, instance, validated_data):
         password = validated_data.pop('password', None)
         profile_data = validated_data.pop('profile', {})
 
-        for (key, value) in validated_data.items():
-            setattr(instance, key, value)
+        # Only the columns that actually changed are written, and a row with
+        # no changes is not saved at all.
+        changed = [key for (key, value) in validated_data.items() if getattr(instance, key) != value]
+        for key in changed:
+            setattr(instance, key, validated_data[key])
 
         if password is not None:
             instance.set_password(password)
+            changed.append('password')
 
-        instance.save()
+        if changed:
+            instance.save(update_fields=changed + ['updated_at'])
 
-        for (key, value) in profile_data.items():
-            setattr(instance.profile, key, value)
+        profile = instance.profile
+        changed = [key for (key, value) in profile_data.items() if getattr(profile, key) != value]
+        for key in changed:
+            setattr(profile, key, profile_data[key])
 
-        instance.profile.save()
+        if changed:
+            profile.save(update_fields=changed + ['updated_at'])
 
         return instance
@@ -0,0 +1,41 @@
+import logging
+import threading
+
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL = getattr(settings, 'SESSION_PURGE_INTERVAL', 60 * 60)
+PURGE_KEY = 'portalapp:session-purge'
+
+
+def purge_expired_sessions():
+    engine = import_module(settings.SESSION_ENGINE)
+    engine.SessionStore.clear_expired()
+
+
+def _purge_in_worker():
+    try:
+        purge_expired_sessions()
+    except Exception:
+        logger.exception('Purging expired sessions failed.')
+    finally:
+        connection.close()
+
+
+def schedule_purge():
+    # The cache key throttles purges to one per interval among the processes
+    # that share the cache: all of them with memcached or redis, but each one
+    # on its own with the default LocMemCache. Purging is idempotent, so the
+    # extra runs only cost a DELETE. It runs off the request thread.
+    if not PURGE_INTERVAL or not cache.add(PURGE_KEY, True, PURGE_INTERVAL):
+        return None
+
+    thread = threading.Thread(target=_purge_in_worker)
+    thread.daemon = True
+    thread.start()
+    return thread
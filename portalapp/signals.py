@@ -1,16 +1,161 @@
-from django.db.models.signals import post_save
+import threading
+
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
+from . import documents, experience, facets, matching, search
+from .images import image_changed, schedule_profile_image
+from .sessions import schedule_purge
+from .backends import invalidate_user
+from .cache import profile_cache
 from .models import Profile
 from .models import User, Basic, Experience, Education, Skill, Project
 
 
+# Profiles changed by the transaction open on this thread, refreshed
+# together when it commits.
+_pending = threading.local()
+
+
+def refresh_profiles(profile_ids):
+    experience.refresh_experience(profile_ids)
+    search.index_profiles(profile_ids)
+    documents.build_documents(profile_ids)
+    matching.index_profiles(profile_ids)
+    facets.refresh_facets(profile_ids)
+
+
+def _refresh_pending():
+    profile_ids = getattr(_pending, 'profile_ids', None)
+    _pending.profile_ids = None
+    if profile_ids:
+        refresh_profiles(profile_ids)
+
+
+def profiles_changed(profile_ids):
+    if not transaction.get_connection().in_atomic_block:
+        refresh_profiles(profile_ids)
+        return
+
+    pending = getattr(_pending, 'profile_ids', None)
+    if pending is None:
+        pending = _pending.profile_ids = set()
+    pending.update(profile_ids)
+
+    # A savepoint that rolls back drops the callbacks registered inside it,
+    # and which ones it dropped is not visible, so every change registers
+    # one. The first to run refreshes the whole batch; the rest find it gone.
+    transaction.on_commit(_refresh_pending)
+
+
 @receiver(post_save, sender=User)
 def create_related_profile(sender, instance, created, *args, **kwargs):
     if instance and created:
-        instance.profile = Profile.objects.create(user=instance)
-        instance.profile.userprofilebasicInfo = Basic.objects.create(profile=instance.profile)
-        instance.profile.Experience = Experience.objects.create(profile=instance.profile)
-        instance.profile.Education = Education.objects.create(profile=instance.profile)
-        instance.profile.Skills = Skill.objects.create(profile=instance.profile)
-        instance.profile.projects = Project.objects.create(profile=instance.profile)
+        with transaction.atomic():
+            instance.profile = Profile.objects.create(user=instance)
+            instance.profile.userprofilebasicInfo = Basic.objects.create(profile=instance.profile)
+            instance.profile.Experience = Experience.objects.create(profile=instance.profile)
+            instance.profile.Education = Education.objects.create(profile=instance.profile)
+            instance.profile.Skills = Skill.objects.create(profile=instance.profile)
+            instance.profile.projects = Project.objects.create(profile=instance.profile)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_profile(sender, instance, *args, **kwargs):
+    profile_cache.bump(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_authenticated_user(sender, instance, *args, **kwargs):
+    # Until the write commits, other requests still read the old row; a
+    # version bumped before then would let them cache it as current.
+    transaction.on_commit(partial(invalidate_user, instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile(sender, instance, *args, **kwargs):
+    profile_cache.bump(instance.user_id)
+
+
+@receiver(post_save, sender=Basic)
+@receiver(post_delete, sender=Basic)
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=Experience)
+@receiver(post_save, sender=Education)
+@receiver(post_delete, sender=Education)
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_profile_section(sender, instance, *args, **kwargs):
+    if sender.profile.is_cached(instance):
+        user_id = instance.profile.user_id
+    else:
+        user_id = Profile.objects.filter(pk=instance.profile_id).values_list(
+            'user_id', flat=True
+        ).first()
+
+    if user_id is not None:
+        profile_cache.bump(user_id)
+
+
+@receiver(post_save, sender=User)
+def refresh_user_profile(sender, instance, created, update_fields=None, *args, **kwargs):
+    # New users are handled by create_related_profile, and saves limited to
+    # other fields (last_login on every login) change nothing derived.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+
+    profiles_changed(Profile.objects.filter(user_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def refresh_profile(sender, instance, *args, **kwargs):
+    profiles_changed([instance.pk])
+
+
+@receiver(post_save, sender=Basic)
+@receiver(post_delete, sender=Basic)
+@receiver(post_save, sender=Experience)
+@receiver(post_delete, sender=Experience)
+@receiver(post_save, sender=Education)
+@receiver(post_delete, sender=Education)
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def refresh_profile_section(sender, instance, *args, **kwargs):
+    profiles_changed([instance.profile_id])
+
+
+@receiver(pre_delete, sender=Profile)
+def remove_profile_facets(sender, instance, *args, **kwargs):
+    # The memberships go with the profile, so its counts are taken back
+    # while they can still be read.
+    facets.remove_profile(instance.pk)
+
+
+@receiver(pre_delete, sender=Profile)
+def remove_profile_search_document(sender, instance, *args, **kwargs):
+    # Taken out of the index, and of its statistics, before the cascade
+    # deletes the document unaccounted.
+    search.remove_profile(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def process_profile_image(sender, instance, update_fields=None, *args, **kwargs):
+    if image_changed(instance, update_fields):
+        transaction.on_commit(partial(schedule_profile_image, instance.pk))
+
+
+@receiver(user_logged_in)
+def purge_expired_sessions(sender, *args, **kwargs):
+    transaction.on_commit(schedule_purge)
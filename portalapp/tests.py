@@ -1,3 +1,1539 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import decimal
+import json
+import os
+import shutil
+import tempfile
+import time
 
-# Create your tests here.
+from unittest import skipUnless
+
+import jwt
+import msgpack
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import six, timezone
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_jwt.settings import api_settings
+
+from .backends import (
+    DispatchingAuthentication, JWTAuthentication, payload_cache, shared_user_cache, token_digest,
+    user_cache
+)
+from .bulk import bulk_update, import_profiles, register_users, sync_section
+from .cache import LRUCache, profile_cache
+from .models import User, Profile, Basic, Experience, Education, Skill, Project
+from .models import FacetCount, MatchVector, ProfileDocument, ProfileFacet, SearchDocument, SearchStats
+from .serializers import ProfileSerializer, UserSerializer
+from .search import index_profiles, search
+from .sessions import PURGE_KEY, schedule_purge
+from .documents import build_documents, verify_documents
+from .experience import merged_days
+from .matching import MatchingIndex, skill_features
+from .matching import index_profiles as index_match_vectors
+from . import bulk, views
+from .export import iter_profiles
+from .images import IMAGE_SIZES, process_profile_image, schedule_profile_image, variant_name
+from .instrumentation import registry
+from .pagination import EstimatedCountPaginator
+from . import routers
+from .routers import ReplicaRouter
+from .renderers import ProfileListJSONRenderer, UserJSONRenderer
+
+
+class ProfileRetrieveQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def add_sections(self, count):
+        profile = self.user.profile
+        for i in range(count):
+            Experience.objects.create(profile=profile, company='Company %d' % i)
+            Education.objects.create(profile=profile, institute='Institute %d' % i)
+            Skill.objects.create(profile=profile, skill='Skill %d' % i)
+            Project.objects.create(profile=profile, headline='Project %d' % i)
+
+    def test_with_sections_loads_profile_in_constant_queries(self):
+        self.add_sections(10)
+        with self.assertNumQueries(5):
+            profile = Profile.objects.with_sections().get(user__username='alice')
+            [p.profile.user.username for p in profile.project_set.all()]
+            profile.basic.city
+
+    def test_retrieve_query_count_does_not_grow_with_rows(self):
+        # Documents are built on commit, so these reads look for one and
+        # fall back to loading the rows.
+        with self.assertNumQueries(6):
+            response = self.client.get('/accounts/profile/')
+        self.assertEqual(response.status_code, 200)
+
+        self.add_sections(10)
+        with self.assertNumQueries(6):
+            response = self.client.get('/accounts/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['projects']), 11)
+        self.assertEqual(response.data['projects'][0]['username'], 'alice')
+
+
+class ProfileResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        profile_cache.reset_stats()
+        self.user = User.objects.create_user('bob', 'bob@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_second_read_is_served_from_cache(self):
+        first = self.client.get('/accounts/profile/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/accounts/profile/')
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(profile_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_section_write_bumps_version(self):
+        self.client.get('/accounts/profile/')
+        Skill.objects.create(profile=self.user.profile, skill='Django')
+
+        response = self.client.get('/accounts/profile/')
+
+        self.assertIn('Django', [s['skill'] for s in response.data['skills']])
+        self.assertEqual(profile_cache.stats(), {'hits': 0, 'misses': 2})
+
+    def test_every_model_invalidates(self):
+        profile = self.user.profile
+        writes = [
+            lambda: self.user.save(),
+            lambda: profile.save(),
+            lambda: Basic.objects.get(profile=profile).save(),
+            lambda: Experience.objects.filter(profile=profile).delete(),
+            lambda: Education.objects.filter(profile=profile).delete(),
+            lambda: Project.objects.create(profile=profile),
+        ]
+        for write in writes:
+            version = profile_cache.version(self.user.pk)
+            write()
+            self.assertGreater(profile_cache.version(self.user.pk), version)
+
+
+class BatchRegistrationTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def rows(self, count):
+        return [
+            {'email': 'user%d@example.com' % i, 'username': 'user%d' % i, 'password': 'password123'}
+            for i in range(count)
+        ]
+
+    def test_creates_users_and_sections_in_constant_queries(self):
+        with self.assertNumQueries(13):
+            created, failed = register_users(self.rows(3))
+        with self.assertNumQueries(13):
+            register_users(self.rows(30)[3:])
+
+        self.assertEqual(failed, [])
+        self.assertEqual([u['username'] for u in created], ['user0', 'user1', 'user2'])
+        user = User.objects.get(username='user1')
+        self.assertTrue(user.check_password('password123'))
+        for model in (Basic, Experience, Education, Skill, Project):
+            self.assertEqual(model.objects.filter(profile__user=user).count(), 1)
+
+    def test_reports_row_errors_without_aborting_batch(self):
+        rows = self.rows(2) + [
+            {'email': 'admin@example.com', 'username': 'other', 'password': 'password123'},
+            {'email': 'user0@example.com', 'username': 'user9', 'password': 'password123'},
+            {'email': 'short@example.com', 'username': 'short', 'password': 'short'},
+        ]
+        response = self.client.post('/register/batch/', {'users': rows}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.content)['registrations']
+        self.assertEqual(len(data['created']), 2)
+        self.assertEqual([f['index'] for f in data['failed']], [2, 3, 4])
+        self.assertIn('email', data['failed'][0]['errors'])
+        self.assertIn('password', data['failed'][2]['errors'])
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post('/register/batch/', {'users': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_rejects_body_that_is_not_an_object(self):
+        response = self.client.post('/register/batch/', self.rows(2), format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('users', json.loads(response.content)['errors'])
+        self.assertFalse(User.objects.filter(username='user0').exists())
+
+    def test_rows_taken_concurrently_fail_alone(self):
+        User.objects.create_user('racer', 'user1@example.com', 'password123')
+        # As if the user above registered after the batch checked for it.
+        taken = bulk._taken
+        bulk._taken = lambda candidates: {'email': set(), 'username': set()}
+        try:
+            created, failed = register_users(self.rows(3))
+        finally:
+            bulk._taken = taken
+
+        self.assertEqual([u['username'] for u in created], ['user0', 'user2'])
+        self.assertEqual([f['index'] for f in failed], [1])
+        self.assertEqual(list(failed[0]['errors']), ['email'])
+        self.assertEqual(Profile.objects.filter(user__username__in=['user0', 'user2']).count(), 2)
+
+
+class JWTUserCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user('carol', 'carol@example.com', 'password123')
+        token = jwt.encode(
+            {'user_id': self.user.pk, 'exp': int(time.time()) + 60},
+            settings.SECRET_KEY
+        ).decode('utf-8')
+        self.request = RequestFactory().get('/user/', HTTP_AUTHORIZATION='Token ' + token)
+
+    def test_repeat_authentication_skips_database(self):
+        JWTAuthentication().authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = JWTAuthentication().authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_invalidation_from_another_worker_reaches_local_cache(self):
+        JWTAuthentication().authenticate(self.request)
+        # Another worker's save leaves this process's LRU alone and only
+        # bumps the shared version.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        shared_user_cache.bump(self.user.pk)
+
+        self.assertEqual(len(user_cache), 1)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication().authenticate(self.request)
+
+    def test_lru_is_bounded_and_expires(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        lru.set('d', 4, ttl=0)
+
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (None, None, 3))
+        self.assertIsNone(lru.get('d'))
+
+
+
+class JWTUserInvalidationTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user('cora', 'cora@example.com', 'password123')
+        self.token = jwt.encode(
+            {'user_id': self.user.pk, 'exp': int(time.time()) + 60},
+            settings.SECRET_KEY
+        ).decode('utf-8')
+        self.request = RequestFactory().get('/user/', HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_deactivation_locks_user_out_immediately(self):
+        JWTAuthentication().authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication().authenticate(self.request)
+
+    def test_user_cached_before_commit_is_not_served_after_it(self):
+        JWTAuthentication().authenticate(self.request)
+        with transaction.atomic():
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request still reads the committed, active row
+            # and caches it under the version current at that moment.
+            stale = User.objects.get(pk=self.user.pk)
+            stale.is_active = True
+            version = shared_user_cache.version(self.user.pk)
+            user_cache.set((self.user.pk, token_digest(self.token)), (version, stale))
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication().authenticate(self.request)
+
+
+class ProfileDirectoryTest(TestCase):
+    def setUp(self):
+        register_users([
+            {'email': 'dir%d@example.com' % i, 'username': 'dir%d' % i, 'password': 'password123'}
+            for i in range(5)
+        ])
+        Basic.objects.filter(profile__user__username='dir1').update(state='Goa', city='Panaji')
+        Skill.objects.filter(profile__user__username='dir2').update(skill='Python')
+        Experience.objects.filter(profile__user__username='dir3').update(company='Infosys')
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.get(username='dir0'))
+
+    def usernames(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [p['username'] for p in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.usernames('/profiles/?state=Goa'), ['dir1'])
+        self.assertEqual(self.usernames('/profiles/?city=Panaji&state=Goa'), ['dir1'])
+        self.assertEqual(self.usernames('/profiles/?skill=Python'), ['dir2'])
+        self.assertEqual(self.usernames('/profiles/?company=Infosys'), ['dir3'])
+        self.assertEqual(self.usernames('/profiles/?company=Infosys&skill=Python'), [])
+
+    def test_cursor_pages_in_constant_queries(self):
+        seen = []
+        url = '/profiles/?page_size=2'
+        while url:
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            seen += [p['username'] for p in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sorted(seen), ['dir%d' % i for i in range(5)])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        register_users([
+            {'email': 's%d@example.com' % i, 'username': 's%d' % i, 'password': 'password123'}
+            for i in range(4)
+        ])
+        Skill.objects.filter(profile__user__username='s0').update(skill='Django')
+        Skill.objects.filter(profile__user__username='s1').update(skill='Django Python')
+        Basic.objects.filter(profile__user__username='s1').update(city='Pune')
+        Education.objects.filter(profile__user__username='s2').update(institute='IIT Bombay')
+        index_profiles(Profile.objects.values_list('pk', flat=True))
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.get(username='s0'))
+
+    def usernames(self, query):
+        response = self.client.get('/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [p['username'] for p in response.data['results']]
+
+    def test_ranks_profiles_matching_more_terms_first(self):
+        # Every default profile has a "Django project" headline in Bengaluru.
+        self.assertEqual(self.usernames('django bengaluru'), ['s0', 's2', 's3', 's1'])
+        self.assertEqual(self.usernames('django pune')[0], 's1')
+        self.assertEqual(self.usernames('iit bombay'), ['s2'])
+        self.assertNotIn('s2', self.usernames('vnit'))
+        self.assertEqual(self.usernames('nonexistent'), [])
+
+    def test_pages(self):
+        count, page = search('bengaluru', limit=2, offset=1)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(page), 2)
+
+    def test_scores_and_pages_in_sql(self):
+        # Stats row, document frequencies, match count and the page itself.
+        with self.assertNumQueries(4):
+            count, page = search('django bengaluru', limit=1)
+        self.assertEqual(count, 4)
+        self.assertEqual(len(page), 1)
+
+        stats = SearchStats.objects.get()
+        self.assertEqual(stats.documents, SearchDocument.objects.count())
+        self.assertEqual(stats.total_length, sum(SearchDocument.objects.values_list('length', flat=True)))
+
+        for params in ({'limit': -1}, {'limit': 0}, {'offset': -5}):
+            params['q'] = 'django'
+            self.assertEqual(self.client.get('/search/', params).status_code, 400)
+
+    def test_index_writes_only_update_the_stats_row(self):
+        profile_ids = list(Profile.objects.values_list('pk', flat=True)[:2])
+        Skill.objects.create(profile_id=profile_ids[0], skill='Erlang')
+        with CaptureQueriesContext(connection) as captured:
+            index_profiles(profile_ids)
+
+        stats_queries = [query['sql'] for query in captured if 'portalapp_searchstats' in query['sql']]
+        self.assertEqual(len(stats_queries), 1)
+        self.assertTrue(stats_queries[0].startswith('UPDATE'))
+
+
+class SearchIndexSignalTest(TransactionTestCase):
+    def test_index_follows_section_writes(self):
+        user = User.objects.create_user('dave', 'dave@example.com', 'password123')
+        self.assertEqual(SearchDocument.objects.count(), 1)
+
+        Skill.objects.create(profile=user.profile, skill='Haskell')
+        self.assertEqual([pk for pk, _ in search('haskell')[1]], [user.profile.pk])
+
+        Skill.objects.filter(skill='Haskell').delete()
+        self.assertEqual(search('haskell'), (0, []))
+
+        User.objects.create_user('erin', 'erin@example.com', 'password123')
+        user.delete()
+        self.assertEqual(SearchDocument.objects.count(), 1)
+        stats = SearchStats.objects.get()
+        self.assertEqual(stats.documents, 1)
+        self.assertEqual(stats.total_length, SearchDocument.objects.get().length)
+
+    def test_changes_after_a_rollback_are_refreshed_on_commit(self):
+        user = User.objects.create_user('fred', 'fred@example.com', 'password123')
+
+        class Abort(Exception):
+            pass
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Skill.objects.create(profile=user.profile, skill='Erlang')
+                    raise Abort
+            except Abort:
+                pass
+            Skill.objects.create(profile=user.profile, skill='Haskell')
+
+        try:
+            with transaction.atomic():
+                Skill.objects.create(profile=user.profile, skill='Erlang')
+                raise Abort
+        except Abort:
+            pass
+        with transaction.atomic():
+            Skill.objects.create(profile=user.profile, skill='Cobol')
+
+        self.assertEqual([pk for pk, _ in search('haskell')[1]], [user.profile.pk])
+        self.assertEqual([pk for pk, _ in search('cobol')[1]], [user.profile.pk])
+        self.assertEqual(search('erlang'), (0, []))
+
+
+class ProfileExportTest(TestCase):
+    def setUp(self):
+        register_users([
+            {'email': 'e%d@example.com' % i, 'username': 'e%d' % i, 'password': 'password123'}
+            for i in range(5)
+        ])
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_reads_in_prefetched_chunks(self):
+        # Five queries per chunk of two, plus the empty chunk that ends it.
+        with self.assertNumQueries(3 * 5 + 1):
+            exported = list(iter_profiles(chunk_size=2))
+        self.assertEqual(len(exported), 6)
+
+    def test_streams_ndjson(self):
+        response = self.client.get('/export/profiles/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).splitlines()
+        profiles = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(p['username'] for p in profiles)[:2], ['admin', 'e0'])
+        self.assertEqual(profiles[0]['skills'][0]['skill'], 'Java')
+
+    def test_streams_csv(self):
+        response = self.client.get('/export/profiles/', {'output': 'csv'})
+        rows = list(csv.reader(b''.join(response.streaming_content).splitlines()))
+        self.assertEqual(rows[0][:4], ['username', 'bio', 'image', 'basic_dob'])
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(json.loads(rows[1][-2])[0]['skill'], 'Java')
+
+    def test_rejects_unknown_output_and_non_admins(self):
+        self.assertEqual(self.client.get('/export/profiles/', {'output': 'xml'}).status_code, 400)
+        self.client.force_authenticate(user=User.objects.get(username='e0'))
+        self.assertEqual(self.client.get('/export/profiles/').status_code, 403)
+
+
+class ImportProfilesTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'profiles.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def row(self, i, **extra):
+        row = {
+            'email': 'imp%d@example.com' % i,
+            'username': 'imp%d' % i,
+            'password': 'password123',
+            'bio': 'Bio %d' % i,
+            'basic': {'city': 'Pune', 'state': 'Maharashtra'},
+            'experience': [{'company': 'TCS', 'designation': 'Engineer',
+                            'start_date': '2015-01-01', 'end_date': '2018-01-01'}],
+            'skills': [{'skill': 'Python', 'last_used': '2018-01-01'},
+                       {'skill': 'Go', 'last_used': '2017-01-01'}],
+        }
+        row.update(extra)
+        return row
+
+    def test_creates_and_updates_in_constant_queries(self):
+        with self.assertNumQueries(11):
+            created, updated, failed = import_profiles(
+                [(i, self.row(i)) for i in range(3)] +
+                [(3, self.row(3, basic={'state': 'Atlantis'})), (4, 'not a dict')]
+            )
+        self.assertEqual(created, ['imp0', 'imp1', 'imp2'])
+        self.assertEqual([f['key'] for f in failed], [3, 4])
+
+        profile = Profile.objects.get(user__username='imp1')
+        self.assertEqual(profile.bio, 'Bio 1')
+        self.assertEqual(profile.basic.city, 'Pune')
+        self.assertEqual(sorted(profile.skill_set.values_list('skill', flat=True)), ['Go', 'Python'])
+        self.assertEqual(profile.education_set.count(), 0)
+        self.assertTrue(User.objects.get(username='imp1').check_password('password123'))
+
+        created, updated, failed = import_profiles([
+            (0, self.row(1, bio='New bio', basic={'city': 'Nagpur'},
+                         skills=[{'skill': 'Rust', 'last_used': '2018-05-01'}])),
+        ])
+        self.assertEqual((created, updated, failed), ([], ['imp1'], []))
+
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertEqual(profile.bio, 'New bio')
+        self.assertEqual((profile.basic.city, profile.basic.state), ('Nagpur', 'Maharashtra'))
+        self.assertEqual(list(profile.skill_set.values_list('skill', flat=True)), ['Rust'])
+        self.assertEqual(profile.experience_set.count(), 1)
+
+    def test_bulk_update_sets_per_row_values(self):
+        register_users([{'email': 'bu%d@example.com' % i, 'username': 'bu%d' % i,
+                         'password': 'password123'} for i in range(3)])
+        skills = list(Skill.objects.order_by('pk'))
+        for skill in skills:
+            skill.skill = 'Skill %d' % skill.pk
+        with self.assertNumQueries(1):
+            bulk_update(skills, ['skill'])
+        self.assertEqual(
+            list(Skill.objects.order_by('pk').values_list('skill', flat=True)),
+            ['Skill %d' % skill.pk for skill in skills]
+        )
+
+    def test_command_resumes_from_checkpoint(self):
+        with open(self.path, 'w') as source:
+            for i in range(5):
+                source.write(json.dumps(self.row(i)) + '\n')
+        with open(self.path, 'rb') as source:
+            source.readline()
+            source.readline()
+            offset = source.tell()
+        with open(self.path + '.checkpoint', 'w') as checkpoint:
+            json.dump({'offset': offset, 'line': 2}, checkpoint)
+
+        out = six.StringIO()
+        call_command('import_profiles', self.path, batch_size=2, stdout=out)
+
+        self.assertIn('Resuming after line 2.', out.getvalue())
+        self.assertIn('3 created', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)), ['imp2', 'imp3', 'imp4']
+        )
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+class ConduitJSONRendererTest(TestCase):
+    def test_encodes_dates_and_decimals_natively(self):
+        content = UserJSONRenderer().render({
+            'token': b'abc',
+            'joined': datetime.datetime(2018, 8, 21, 14, 30, tzinfo=timezone.utc),
+            'dob': datetime.date(1990, 1, 2),
+            'salary': decimal.Decimal('13.3'),
+        })
+        self.assertEqual(json.loads(content.decode('utf-8')), {'user': {
+            'token': 'abc',
+            'joined': '2018-08-21T14:30:00Z',
+            'dob': '1990-01-02',
+            'salary': 13.3,
+        }})
+
+    def test_errors_are_not_wrapped(self):
+        content = UserJSONRenderer().render({'errors': {'email': ['Required.']}})
+        self.assertEqual(json.loads(content.decode('utf-8')), {'errors': {'email': ['Required.']}})
+
+    def test_streamed_list_matches_render(self):
+        renderer = ProfileListJSONRenderer()
+        items = [{'username': u'user\u00e9%d' % i, 'dob': datetime.date(2000, 1, i + 1)} for i in range(7)]
+        streamed = b''.join(renderer.iter_render(iter(items), chunk_size=3))
+        self.assertEqual(json.loads(streamed.decode('utf-8')), json.loads(renderer.render(items).decode('utf-8')))
+        self.assertEqual(b''.join(renderer.iter_render([])), b'{"profiles":[]}')
+
+
+class ProfileImagePipelineTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user('erin', 'erin@example.com', 'password123')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, color):
+        buffer = six.BytesIO()
+        Image.new('RGBA', (1200, 800), color).save(buffer, 'PNG')
+        profile = Profile.objects.get(user=self.user)
+        profile.image.save('avatar.png', ContentFile(buffer.getvalue()))
+        return profile
+
+    def test_writes_resized_content_hashed_variants(self):
+        profile = self.upload('red')
+        process_profile_image(profile.pk)
+
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertEqual(len(profile.image_hash), 40)
+        for name, size in IMAGE_SIZES.items():
+            path = variant_name(profile.image_hash, name)
+            with default_storage.open(path) as variant:
+                image = Image.open(variant)
+                self.assertEqual((image.format, max(image.size)), ('JPEG', size))
+
+        images = ProfileSerializer(profile).data['images']
+        self.assertEqual(images['thumbnail'], default_storage.url(variant_name(profile.image_hash, 'thumbnail')))
+
+    def test_unprocessed_profiles_fall_back_to_original(self):
+        data = ProfileSerializer(Profile.objects.get(user=self.user)).data
+        self.assertEqual(set(data['images'].values()), {data['image']})
+
+        # The default image is not processed at all.
+        process_profile_image(self.user.profile.pk)
+        self.assertEqual(Profile.objects.get(pk=self.user.profile.pk).image_hash, '')
+
+    def test_new_upload_gets_new_variants(self):
+        profile = self.upload('red')
+        process_profile_image(profile.pk)
+        first = Profile.objects.get(pk=profile.pk).image_hash
+
+        profile = self.upload('blue')
+        process_profile_image(profile.pk)
+        self.assertNotEqual(Profile.objects.get(pk=profile.pk).image_hash, first)
+
+        # Nothing refers to the replaced variants any more.
+        self.assertFalse(default_storage.exists(variant_name(first, 'thumbnail')))
+
+    def test_shared_variants_are_kept(self):
+        profile = self.upload('red')
+        process_profile_image(profile.pk)
+        first = Profile.objects.get(pk=profile.pk).image_hash
+        other = User.objects.create_user('fay', 'fay@example.com', 'password123').profile
+        Profile.objects.filter(pk=other.pk).update(image_hash=first)
+
+        profile = self.upload('blue')
+        process_profile_image(profile.pk)
+        self.assertTrue(default_storage.exists(variant_name(first, 'thumbnail')))
+
+    def test_only_new_uploads_are_scheduled(self):
+        def scheduled():
+            return [
+                func.args for _, func in connection.run_on_commit
+                if getattr(func, 'func', None) is schedule_profile_image
+            ]
+
+        # Registration stores the default image, and a bio edit keeps it.
+        self.assertEqual(scheduled(), [])
+        profile = Profile.objects.get(pk=self.user.profile.pk)
+        profile.bio = 'Hello'
+        profile.save()
+        self.assertEqual(scheduled(), [])
+
+        profile = self.upload('red')
+        self.assertEqual(scheduled(), [(profile.pk,)])
+
+        profile = Profile.objects.get(pk=profile.pk)
+        profile.bio = 'Hello again'
+        profile.save()
+        self.assertEqual(len(scheduled()), 1)
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.user = User.objects.create_user('ivan', 'ivan@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_unsampled_requests_are_not_timed(self):
+        response = self.client.get('/accounts/profile/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.snapshot(), {})
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_server_timing_and_histograms(self):
+        response = self.client.get('/accounts/profile/')
+
+        timing = response['Server-Timing']
+        for name in ('serialize', 'render', 'db', 'total'):
+            self.assertIn(name + ';dur=', timing)
+        self.assertIn('desc="6 queries"', timing)
+
+        stats = registry.snapshot()['ProfileRetrieveAPIView']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries'], 6)
+        self.assertEqual(stats['timings']['total']['count'], 1)
+        self.assertEqual(sum(stats['timings']['serialize']['buckets'].values()), 1)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_metrics_endpoint_requires_admin(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('MetricsAPIView', response.data)
+
+    def test_metrics_reset_has_no_body(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        for accept in ('application/json', 'application/msgpack'):
+            response = self.client.delete('/metrics/', HTTP_ACCEPT=accept)
+
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(response.content, b'')
+
+
+class DispatchingAuthenticationTest(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        payload_cache.clear()
+        self.user = User.objects.create_user('judy', 'judy@example.com', 'password123')
+
+    def request(self, authorization):
+        return Request(RequestFactory().get('/user/', HTTP_AUTHORIZATION=authorization))
+
+    def token(self, **payload):
+        payload.setdefault('user_id', self.user.pk)
+        payload.setdefault('exp', int(time.time()) + 60)
+        return jwt.encode(payload, settings.SECRET_KEY).decode('utf-8')
+
+    def test_verified_payload_is_reused(self):
+        request = self.request('Token ' + self.token())
+        DispatchingAuthentication().authenticate(request)
+
+        with self.assertNumQueries(0):
+            user, _ = DispatchingAuthentication().authenticate(request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(len(payload_cache), 1)
+
+    def test_expired_token_is_rejected_and_not_cached(self):
+        request = self.request('Token ' + self.token(exp=int(time.time()) - 10))
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            DispatchingAuthentication().authenticate(request)
+        self.assertEqual(len(payload_cache), 0)
+
+    def test_dispatches_on_prefix(self):
+        token = api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(self.user))
+        user, _ = DispatchingAuthentication().authenticate(self.request('JWT ' + token))
+        self.assertEqual(user.pk, self.user.pk)
+
+        basic = base64.b64encode(b'judy@example.com:password123').decode('ascii')
+        user, _ = DispatchingAuthentication().authenticate(self.request('Basic ' + basic))
+        self.assertEqual(user.pk, self.user.pk)
+
+        self.assertIsNone(DispatchingAuthentication().authenticate(self.request('Bearer abc')))
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_auth_stage_is_timed(self):
+        response = APIClient().get('/user/', HTTP_AUTHORIZATION='Token ' + self.token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('auth;dur=', response['Server-Timing'])
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'password123')
+        self.client.force_login(self.admin)
+
+    def add_users(self, start, count):
+        for i in range(start, start + count):
+            user = User.objects.create_user('admin%d' % i, 'admin%d@example.com' % i, 'password123')
+            Experience.objects.create(profile=user.profile, company='Company %d' % i)
+            Skill.objects.create(profile=user.profile, skill='Skill %d' % i)
+            Project.objects.create(profile=user.profile, headline='Project %d' % i)
+
+    def query_counts(self):
+        counts = {}
+        for model in ('user', 'profile', 'basic', 'experience', 'education', 'skill', 'project'):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/admin/portalapp/{}/'.format(model))
+            self.assertEqual(response.status_code, 200)
+            counts[model] = len(captured)
+        return counts
+
+    def test_changelists_run_in_constant_queries(self):
+        self.add_users(0, 2)
+        before = self.query_counts()
+        self.add_users(2, 8)
+
+        self.assertEqual(self.query_counts(), before)
+
+    def test_search_replaces_related_filter(self):
+        self.add_users(0, 3)
+        response = self.client.get('/admin/portalapp/experience/', {'q': 'admin1'})
+
+        self.assertEqual(
+            {row.profile.user.username for row in response.context['cl'].result_list},
+            {'admin1'}
+        )
+
+    def test_paginator_counts_exactly_without_an_estimate(self):
+        self.add_users(0, 3)
+        paginator = EstimatedCountPaginator(Skill.objects.all(), 2)
+
+        self.assertEqual(paginator.count, Skill.objects.count())
+
+
+class ProfileSectionSyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('kate', 'kate@example.com', 'password123')
+        self.profile = self.user.profile
+        Skill.objects.filter(profile=self.profile).delete()
+        for name in ('Python', 'Django', 'Go'):
+            Skill.objects.create(profile=self.profile, skill=name, last_used=datetime.date(2020, 1, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def skills(self):
+        return sorted(Skill.objects.filter(profile=self.profile).values_list('skill', 'last_used'))
+
+    def test_unchanged_rows_are_not_written(self):
+        ids = set(Skill.objects.filter(profile=self.profile).values_list('pk', flat=True))
+        entries = [
+            {'skill': 'Python', 'last_used': datetime.date(2020, 1, 1)},
+            {'skill': 'Rust', 'last_used': datetime.date(2021, 1, 1)},
+            {'skill': 'Go', 'last_used': datetime.date(2020, 1, 1)},
+            {'skill': 'SQL', 'last_used': datetime.date(2021, 1, 1)},
+        ]
+
+        changes = sync_section(self.profile, 'skills', entries)
+
+        self.assertEqual(changes, {'created': 1, 'updated': 1, 'deleted': 0})
+        self.assertEqual(self.skills(), sorted((e['skill'], e['last_used']) for e in entries))
+        self.assertTrue(ids < set(Skill.objects.filter(profile=self.profile).values_list('pk', flat=True)))
+
+    def test_put_replaces_section_in_constant_queries(self):
+        entries = [{'skill': 'Skill %d' % i, 'last_used': '2021-01-01'} for i in range(10)]
+        # Profile, savepoint, section read, one UPDATE, one INSERT, release
+        # and the re-read for the response.
+        with self.assertNumQueries(7):
+            response = self.client.put('/accounts/profile/skills/', {'skills': entries}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['changes'], {'created': 7, 'updated': 3, 'deleted': 0})
+        self.assertEqual(len(response.data['skills']), 10)
+
+        response = self.client.put('/accounts/profile/skills/', entries[:2], format='json')
+        self.assertEqual(response.data['changes'], {'created': 0, 'updated': 0, 'deleted': 8})
+
+    def test_rejects_invalid_entries(self):
+        response = self.client.put(
+            '/accounts/profile/skills/', {'skills': [{'last_used': 'soon'}]}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.skills()), 3)
+
+    def test_user_update_writes_only_changed_columns(self):
+        serializer = UserSerializer(
+            self.user, data={'username': 'kate', 'profile': {'bio': ''}}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.assertNumQueries(0):
+            serializer.save()
+
+        serializer = UserSerializer(
+            self.user, data={'username': 'kate', 'profile': {'bio': 'Hi'}}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as captured:
+            serializer.save()
+
+        updates = [query['sql'] for query in captured if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"image"', updates[0])
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).bio, 'Hi')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('liam', 'liam@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_matching_etag_skips_serialization(self):
+        first = self.client.get('/accounts/profile/')
+        etag = first['ETag']
+        cache.clear()
+
+        # The document lookup (none is built inside a test transaction) and
+        # the validator query.
+        with self.assertNumQueries(2):
+            response = self.client.get('/accounts/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Served from the response cache, the validators cost no query.
+        self.client.get('/accounts/profile/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/accounts/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        first = self.client.get('/accounts/profile/')
+        cache.clear()
+
+        response = self.client.get(
+            '/accounts/profile/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_section_writes_change_the_etag(self):
+        etags = [self.client.get('/accounts/profile/')['ETag']]
+        profile = self.user.profile
+        writes = [
+            lambda: Skill.objects.create(profile=profile, skill='Go'),
+            lambda: Skill.objects.filter(profile=profile, skill='Go').delete(),
+            lambda: Profile.objects.filter(pk=profile.pk).update(image_hash='a' * 40),
+        ]
+        for write in writes:
+            write()
+            cache.clear()
+            response = self.client.get('/accounts/profile/', HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+
+        # Deleting the new skill restores the original state, and its tag.
+        self.assertEqual(etags[2], etags[0])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_each_media_type_has_its_own_etag(self):
+        for url in ('/accounts/profile/', '/user/'):
+            as_json = self.client.get(url)
+            as_msgpack = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+            self.assertNotEqual(as_json['ETag'], as_msgpack['ETag'])
+            self.assertIn('Accept', as_msgpack['Vary'])
+
+            response = self.client.get(
+                url, HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=as_json['ETag']
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+
+            response = self.client.get(
+                url, HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=as_msgpack['ETag']
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_user_endpoint(self):
+        first = self.client.get('/user/')
+        self.assertTrue(first['ETag'].startswith('W/'))
+
+        response = self.client.get('/user/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ProfileDocumentTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('mia', 'mia@example.com', 'password123')
+        self.profile = Profile.objects.get(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def expected(self):
+        profile = Profile.objects.with_sections().get(pk=self.profile.pk)
+        return json.loads(json.dumps(ProfileSerializer(profile).data))
+
+    def test_profile_is_served_from_document(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get('/accounts/profile/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['profile'], self.expected())
+
+    def test_documents_follow_every_write(self):
+        other = User.objects.create_user('noah', 'noah@example.com', 'password123')
+
+        def move_to_pune():
+            basic = Basic.objects.get(profile=self.profile)
+            basic.city = 'Pune'
+            basic.save()
+
+        writes = [
+            move_to_pune,
+            lambda: Experience.objects.create(profile=self.profile, company='Flipkart'),
+            lambda: Education.objects.filter(profile=self.profile).delete(),
+            lambda: Project.objects.create(profile=self.profile, headline='Search'),
+            lambda: sync_section(self.profile, 'skills', [{'skill': 'Go'}, {'skill': 'Rust'}]),
+            lambda: User.objects.filter(pk=self.user.pk).get().save(),
+            lambda: setattr(self.user, 'username', 'mia2') or self.user.save(),
+            lambda: Profile.objects.get(pk=self.profile.pk).save(),
+        ]
+        for write in writes:
+            write()
+            self.assertEqual(verify_documents(), [])
+
+        cache.clear()
+        response = self.client.get('/accounts/profile/')
+        self.assertEqual(json.loads(response.content)['profile'], self.expected())
+        self.assertEqual(response.data['username'], 'mia2')
+        self.assertEqual(len(verify_documents()), 0)
+        self.assertTrue(ProfileDocument.objects.filter(profile__user=other).exists())
+
+    def test_command_verifies_and_backfills(self):
+        ProfileDocument.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('build_profile_documents', '--verify', stdout=six.StringIO())
+
+        call_command('build_profile_documents', stdout=six.StringIO())
+        self.assertEqual(verify_documents(), [])
+
+        ProfileDocument.objects.update(data='{}')
+        call_command('build_profile_documents', '--verify', '--fix', stdout=six.StringIO())
+        self.assertEqual(verify_documents(), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def tearDown(self):
+        routers.reset()
+
+    def test_reads_use_replicas_only_when_enabled_and_until_a_write(self):
+        router = ReplicaRouter()
+        routers.reset()
+        self.assertEqual(router.db_for_read(Profile), 'default')
+
+        routers.use_replicas()
+        self.assertEqual(router.db_for_read(Profile), 'replica')
+
+        self.assertEqual(router.db_for_write(Profile), 'default')
+        self.assertEqual(router.db_for_read(Profile), 'default')
+        self.assertTrue(routers.wrote())
+
+    def test_replicas_are_not_migrated(self):
+        router = ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'portalapp'))
+        self.assertTrue(router.allow_migrate('default', 'portalapp'))
+
+
+@skipUnless('replica' in settings.DATABASES, 'Needs a "replica" alias mirroring "default".')
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=30)
+class ReplicaRoutingTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('olga', 'olga@example.com', 'password123')
+        token = jwt.encode(
+            {'user_id': self.user.pk, 'exp': int(time.time()) + 60}, settings.SECRET_KEY
+        ).decode('utf-8')
+        self.authorization = 'Token ' + token
+        self.client = APIClient(HTTP_AUTHORIZATION=self.authorization)
+
+    def replica_queries(self, method, url, **kwargs):
+        # Skip the response cache so every read reaches a database.
+        profile_cache.bump(self.user.pk)
+        with CaptureQueriesContext(connections['replica']) as captured:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300)
+        return len(captured)
+
+    def test_reads_go_to_replica_until_the_client_writes(self):
+        self.assertGreater(self.replica_queries('get', '/accounts/profile/'), 0)
+        self.assertGreater(self.replica_queries('get', '/user/'), 0)
+
+        self.assertEqual(self.replica_queries(
+            'put', '/accounts/profile/skills/', data=[{'skill': 'Go'}], format='json'
+        ), 0)
+
+        self.assertEqual(self.replica_queries('get', '/accounts/profile/'), 0)
+
+    def test_replica_reads_do_not_fill_shared_caches(self):
+        # The replica lags: it still returns the profile as it was before
+        # the write that bumped the cache version.
+        read_document = views.ProfileRetrieveAPIView.__dict__['read_document']
+
+        def lagging(view, user_id):
+            if routers.reading_replicas():
+                return {'data': {'username': 'stale'}, 'etag': '"stale"', 'last_modified': None}
+            return read_document(view, user_id)
+
+        views.ProfileRetrieveAPIView.read_document = lagging
+        try:
+            profile_cache.bump(self.user.pk)
+            user_cache.clear()
+            self.assertEqual(self.client.get('/accounts/profile/').data['username'], 'stale')
+            self.assertEqual(len(user_cache), 0)
+
+            # Pinned to the primary after its write, the client reads its own
+            # profile rather than the stale one.
+            routers.pin(self.authorization)
+            response = self.client.get('/accounts/profile/')
+        finally:
+            views.ProfileRetrieveAPIView.read_document = read_document
+
+        self.assertEqual(response.data['username'], 'olga')
+        self.assertEqual(len(user_cache), 1)
+
+    def test_registered_user_is_found_while_the_replica_lags(self):
+        # The replica has not caught up with users created after setUp.
+        queryset_class = type(User.objects.all())
+        get = queryset_class.__dict__['get']
+        known = self.user.pk
+
+        def lagging(queryset, *args, **kwargs):
+            obj = get(queryset, *args, **kwargs)
+            if queryset.model is User and queryset.db == 'replica' and obj.pk > known:
+                raise User.DoesNotExist
+            return obj
+
+        queryset_class.get = lagging
+        try:
+            response = APIClient().post('/register/', {
+                'username': 'pia', 'email': 'pia@example.com', 'password': 'password123'
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            client = APIClient(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+
+            # Pinned by the user id its registration produced.
+            with CaptureQueriesContext(connections['replica']) as captured:
+                response = client.get('/user/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['username'], 'pia')
+            self.assertEqual(len(captured), 0)
+
+            # Without the pin (another worker's cache), the lookup that
+            # misses on the replica is retried on the primary.
+            cache.clear()
+            user_cache.clear()
+            response = client.get('/user/')
+        finally:
+            queryset_class.get = get
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'pia')
+
+
+class MatchingTest(TestCase):
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.profiles = {}
+        for username, skills in [
+            ('alice', ['Python', 'Django']),
+            ('bob', ['Python', 'Django', 'Go']),
+            ('carol', ['Java', 'Spring']),
+        ]:
+            user = User.objects.create_user(username, username + '@example.com', 'password123')
+            profile = user.profile
+            for model in (Skill, Experience, Education):
+                model.objects.filter(profile=profile).delete()
+            for skill in skills:
+                Skill.objects.create(profile=profile, skill=skill, last_used=self.today)
+            self.profiles[username] = profile.pk
+        index_match_vectors(self.profiles.values())
+        self.index = MatchingIndex()
+        self.usernames = {pk: name for name, pk in self.profiles.items()}
+
+        self.original_index = views.matching_index
+        views.matching_index = self.index
+
+    def tearDown(self):
+        views.matching_index = self.original_index
+
+    def names(self, ranked):
+        return [self.usernames[pk] for pk, _ in ranked]
+
+    def test_similar_ranks_by_cosine(self):
+        self.assertEqual(self.names(self.index.similar(self.profiles['alice'])), ['bob'])
+        self.assertEqual(self.index.similar(self.profiles['carol']), [])
+
+    def test_recent_skills_weigh_more(self):
+        Skill.objects.filter(profile_id=self.profiles['alice'], skill='Python').update(
+            last_used=self.today - datetime.timedelta(days=365 * 4)
+        )
+        index_match_vectors([self.profiles['alice']])
+
+        self.assertEqual(self.names(self.index.match(skill_features(['python']))), ['bob', 'alice'])
+
+    def test_updates_apply_incrementally(self):
+        self.index.similar(self.profiles['alice'])
+        Skill.objects.create(profile_id=self.profiles['carol'], skill='Python', last_used=self.today)
+        index_match_vectors([self.profiles['carol']])
+
+        # Only the vectors written since the last sync are read, and the
+        # ranked profiles are checked to still exist.
+        with self.assertNumQueries(2):
+            ranked = self.index.similar(self.profiles['alice'])
+        self.assertEqual(self.names(ranked), ['bob', 'carol'])
+        self.assertEqual(len(self.index.delta), 4)
+
+        # Rows still inside the lag window are not applied twice.
+        self.index.similar(self.profiles['alice'])
+        self.assertEqual(len(self.index.delta), 4)
+
+        self.index._compact()
+        self.assertEqual(self.index.similar(self.profiles['alice']), ranked)
+        self.assertEqual(len(self.index.main_ids), 3)
+
+    def test_late_commits_and_deletes_are_picked_up(self):
+        self.index.similar(self.profiles['alice'])
+
+        # Written before the newest row the index has seen, but only now
+        # visible, as when its transaction committed late.
+        Skill.objects.create(profile_id=self.profiles['carol'], skill='Django', last_used=self.today)
+        index_match_vectors([self.profiles['carol']])
+        MatchVector.objects.filter(profile_id=self.profiles['carol']).update(
+            written_at=self.index.watermark - datetime.timedelta(seconds=5)
+        )
+        self.assertEqual(self.names(self.index.similar(self.profiles['alice'])), ['bob', 'carol'])
+
+        User.objects.filter(username='bob').delete()
+        self.assertEqual(self.names(self.index.similar(self.profiles['alice'])), ['carol'])
+        self.assertNotIn(self.profiles['bob'], self.index.positions)
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(username='alice'))
+
+        response = client.get('/profiles/alice/similar/')
+        self.assertEqual([row['username'] for row in response.data['results']], ['bob'])
+        self.assertEqual(client.get('/profiles/nobody/similar/').status_code, 400)
+
+        response = client.get('/profiles/match/', {'skills': 'Java,Spring'})
+        self.assertEqual([row['username'] for row in response.data['results']], ['carol'])
+        self.assertEqual(client.get('/profiles/match/').status_code, 400)
+
+
+class FacetCountTest(TransactionTestCase):
+    def counts(self, facet):
+        return dict(FacetCount.objects.filter(facet=facet, count__gt=0).values_list('value', 'count'))
+
+    def test_counts_follow_writes_and_deletes(self):
+        users = [
+            User.objects.create_user('f%d' % i, 'f%d@example.com' % i, 'password123') for i in range(3)
+        ]
+        self.assertEqual(self.counts('city'), {'Bengaluru': 3})
+        self.assertEqual(self.counts('skill'), {'Java': 3})
+
+        # A second row with the same value does not count the profile twice.
+        Skill.objects.create(profile=users[0].profile, skill='java')
+        Skill.objects.create(profile=users[0].profile, skill='Python')
+        with transaction.atomic():
+            basic = Basic.objects.get(profile=users[1].profile)
+            basic.city = 'Pune'
+            basic.save()
+        self.assertEqual(self.counts('skill'), {'Java': 3, 'Python': 1})
+        self.assertEqual(self.counts('city'), {'Bengaluru': 2, 'Pune': 1})
+
+        users[0].delete()
+        self.assertEqual(self.counts('skill'), {'Java': 2})
+        self.assertEqual(self.counts('company'), {'SAP': 2})
+
+    def test_reconcile_repairs_drift(self):
+        for i in range(2):
+            User.objects.create_user('g%d' % i, 'g%d@example.com' % i, 'password123')
+        FacetCount.objects.filter(facet='skill').update(count=7)
+        FacetCount.objects.create(facet='city', value='Atlantis', count=3)
+        # Rebuilding the lost memberships over-counts SAP, which is repaired too.
+        ProfileFacet.objects.filter(facet='company').delete()
+
+        out = six.StringIO()
+        call_command('reconcile_facets', stdout=out)
+
+        self.assertIn('Corrected 3 facet counts.', out.getvalue())
+        self.assertEqual(self.counts('skill'), {'Java': 2})
+        self.assertEqual(self.counts('city'), {'Bengaluru': 2})
+        self.assertEqual(self.counts('company'), {'SAP': 2})
+
+    def test_endpoint_reads_the_rollup_in_constant_queries(self):
+        user = User.objects.create_user('h0', 'h0@example.com', 'password123')
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        with self.assertNumQueries(4):
+            response = client.get('/facets/')
+        for i in range(1, 5):
+            User.objects.create_user('h%d' % i, 'h%d@example.com' % i, 'password123')
+        with self.assertNumQueries(4):
+            response = client.get('/facets/')
+
+        facets = response.data
+        self.assertEqual(facets['skill'], [{'value': 'Java', 'count': 5}])
+        self.assertEqual(facets['state'][0], {'value': 'Karnataka', 'count': 5})
+        self.assertEqual(len(facets['state']), len(Basic.STATES))
+
+
+class ExperienceTotalTest(TransactionTestCase):
+    def test_merged_days_counts_overlaps_once(self):
+        day = datetime.date(2015, 1, 1)
+        span = lambda start, end: (day + datetime.timedelta(days=start), day + datetime.timedelta(days=end))
+        self.assertEqual(merged_days([]), 0)
+        self.assertEqual(merged_days([span(0, 100), span(50, 150), span(200, 210)]), 160)
+        self.assertEqual(merged_days([span(0, 100), span(10, 20), span(100, 120)]), 120)
+        self.assertEqual(merged_days([span(30, 10), span(5, 5)]), 0)
+
+    def test_totals_follow_experience_writes(self):
+        user = User.objects.create_user('exp', 'exp@example.com', 'password123')
+        profile = user.profile
+        total = lambda: Profile.objects.values_list('experience_days', flat=True).get(pk=profile.pk)
+        self.assertEqual(total(), 0)
+
+        first = Experience.objects.create(
+            profile=profile, start_date=datetime.date(2010, 1, 1), end_date=datetime.date(2014, 1, 1)
+        )
+        Experience.objects.create(
+            profile=profile, start_date=datetime.date(2013, 1, 1), end_date=datetime.date(2016, 1, 1)
+        )
+        self.assertEqual(total(), (datetime.date(2016, 1, 1) - datetime.date(2010, 1, 1)).days)
+
+        first.delete()
+        self.assertEqual(total(), (datetime.date(2016, 1, 1) - datetime.date(2013, 1, 1)).days)
+
+        Profile.objects.filter(pk=profile.pk).update(experience_days=1)
+        out = six.StringIO()
+        call_command('rebuild_experience_totals', stdout=out)
+        self.assertIn('Updated 1 profiles.', out.getvalue())
+        self.assertEqual(total(), 1095)
+
+    def test_directory_and_search_filter_by_years(self):
+        for i, years in enumerate((1, 4, 7)):
+            user = User.objects.create_user('y%d' % i, 'y%d@example.com' % i, 'password123')
+            Experience.objects.create(
+                profile=user.profile,
+                start_date=datetime.date(2000, 1, 1),
+                end_date=datetime.date(2000 + years, 1, 1),
+            )
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(username='y0'))
+
+        def usernames(url, params):
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            return sorted(p['username'] for p in response.data['results'])
+
+        self.assertEqual(usernames('/profiles/', {'min_years': 3, 'max_years': 5}), ['y1'])
+        self.assertEqual(usernames('/profiles/', {'min_years': 3}), ['y1', 'y2'])
+        self.assertEqual(usernames('/profiles/', {'max_years': 1.5}), ['y0'])
+        self.assertEqual(usernames('/search/', {'q': 'bengaluru', 'min_years': 2}), ['y1', 'y2'])
+        self.assertEqual(client.get('/profiles/', {'min_years': 'three'}).status_code, 400)
+
+
+class SessionResolutionTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('sess', 'sess@example.com', 'password123')
+
+    def test_profile_reuses_the_session_user(self):
+        client = APIClient()
+        client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/accounts/profile/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'sess')
+        # The session comes from the cache, and the user is loaded once.
+        self.assertFalse([q for q in queries if 'django_session' in q['sql']])
+        self.assertEqual(len([q for q in queries if 'FROM "portalapp_user"' in q['sql']]), 1)
+
+        self.assertEqual(APIClient().get('/accounts/profile/').status_code, 400)
+
+    def test_expired_sessions_are_purged_in_the_background(self):
+        now = timezone.now()
+        Session.objects.create(session_key='expired', session_data='', expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + datetime.timedelta(days=1))
+
+        cache.delete(PURGE_KEY)
+        thread = schedule_purge()
+        thread.join()
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIsNone(schedule_purge())
+
+
+class MessagePackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pack', 'pack@example.com', 'password123')
+        self.client = APIClient()
+
+    def test_negotiates_the_same_envelope_as_json(self):
+        self.client.force_authenticate(user=self.user)
+        as_json = self.client.get('/accounts/profile/')
+        as_msgpack = self.client.get('/accounts/profile/', HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(
+            msgpack.unpackb(as_msgpack.content, raw=False),
+            json.loads(as_json.content.decode('utf-8'))
+        )
+
+    def test_errors_keep_their_shape(self):
+        response = self.client.get('/accounts/profile/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), {
+            'errors': {'detail': 'The requested profile does not exist.'}
+        })
+
+    def test_registration_accepts_msgpack_json_and_legacy_form_bodies(self):
+        def register(**kwargs):
+            return self.client.post('/register/', HTTP_ACCEPT='application/msgpack', **kwargs)
+
+        user = {'username': 'packed', 'email': 'packed@example.com', 'password': 'password123'}
+        response = register(data=msgpack.packb(user), content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['user']['username'], 'packed')
+
+        user = {'username': 'plain', 'email': 'plain@example.com', 'password': 'password123'}
+        self.assertEqual(register(data=user, format='json').status_code, 201)
+
+        user = {'username': 'legacy', 'email': 'legacy@example.com', 'password': 'password123'}
+        response = register(data=json.dumps(user), content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.status_code, 201)
+
+        response = register(data=b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            sorted(User.objects.values_list('username', flat=True)), ['legacy', 'pack', 'packed', 'plain']
+        )
+
+    def test_user_update_accepts_msgpack_and_json_bodies(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.put(
+            '/user/', data=msgpack.packb({'username': 'repacked', 'bio': 'Packed'}),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        user = msgpack.unpackb(response.content, raw=False)['user']
+        self.assertEqual((user['username'], user['bio']), ('repacked', 'Packed'))
+
+        response = self.client.put('/user/', {'email': 'json@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            User.objects.values_list('username', 'email').get(pk=self.user.pk),
+            ('repacked', 'json@example.com')
+        )
+        self.assertEqual(Profile.objects.get(user=self.user).bio, 'Packed')
+
+        response = self.client.put('/user/', [], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        register_users([
+            {'email': 'sp%d@example.com' % i, 'username': 'sp%d' % i, 'password': 'password123'}
+            for i in range(3)
+        ])
+        self.user = User.objects.get(username='sp0')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_retrieve_skips_excluded_sections(self):
+        # Document lookup, validators, profile with its user, and skills.
+        with self.assertNumQueries(4):
+            sparse = self.client.get('/accounts/profile/', {'fields': 'username,image,skills'})
+        self.assertEqual(list(sparse.data), ['username', 'image', 'skills'])
+        self.assertEqual(sparse.data['skills'][0]['skill'], 'Java')
+
+        full = self.client.get('/accounts/profile/')
+        self.assertNotEqual(full['ETag'], sparse['ETag'])
+
+        # Now answered from the cached full profile, with the same tag.
+        with self.assertNumQueries(0):
+            cached = self.client.get('/accounts/profile/', {'fields': 'username,image,skills'})
+        self.assertEqual(cached.data, sparse.data)
+        self.assertEqual(cached['ETag'], sparse['ETag'])
+
+        response = self.client.get(
+            '/accounts/profile/', {'fields': 'skills,username,image'}, HTTP_IF_NONE_MATCH=sparse['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_include_adds_sections_to_the_plain_fields(self):
+        response = self.client.get('/accounts/profile/', {'include': 'projects'})
+        self.assertEqual(list(response.data), ['username', 'bio', 'image', 'images', 'projects'])
+
+        response = self.client.get('/accounts/profile/', {'fields': 'username', 'include': 'basic'})
+        self.assertEqual(list(response.data), ['username', 'basic'])
+
+        response = self.client.get('/accounts/profile/', {'fields': 'username,salary'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors']['fields'], ['Unknown fields: salary.'])
+
+    def test_list_and_search_skip_excluded_sections(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/profiles/', {'fields': 'username,skills'})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(list(response.data['results'][0]), ['username', 'skills'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/profiles/', {'fields': 'username,image'})
+
+        index_profiles(Profile.objects.values_list('pk', flat=True))
+        response = self.client.get('/search/', {'q': 'java', 'fields': 'username'})
+        self.assertEqual([list(p) for p in response.data['results']], [['username', 'score']] * 3)
+
+
+class ProfileBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        register_users([
+            {'email': 'b%d@example.com' % i, 'username': 'b%d' % i, 'password': 'password123'}
+            for i in range(12)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.get(username='b0'))
+
+    def batch(self, **params):
+        response = self.client.get('/profiles/batch/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_loads_any_batch_in_constant_queries(self):
+        # Documents are built on commit, so these fall back to the rows.
+        with self.assertNumQueries(6):
+            data = self.batch(usernames='b1,b2')
+        with self.assertNumQueries(6):
+            data = self.batch(usernames=','.join('b%d' % i for i in range(10)))
+        self.assertEqual(list(data['results']), ['b%d' % i for i in range(10)])
+        self.assertEqual(data['results']['b3'], ProfileSerializer(Profile.objects.get(user__username='b3')).data)
+
+        build_documents(Profile.objects.values_list('pk', flat=True))
+        with self.assertNumQueries(1):
+            documented = self.batch(usernames=','.join('b%d' % i for i in range(10)))
+        self.assertEqual(json.loads(json.dumps(documented)), json.loads(json.dumps(data)))
+
+    def test_reports_missing_keys(self):
+        user_id = User.objects.get(username='b4').pk
+        data = self.batch(usernames='b1,nobody,b1', ids='%d,999999' % user_id, fields='username')
+        self.assertEqual(data['results'], {'b1': {'username': 'b1'}, 'b4': {'username': 'b4'}})
+        self.assertEqual(data['missing'], {'usernames': ['nobody'], 'ids': [999999]})
+
+    @override_settings(PROFILE_BATCH_LIMIT=3)
+    def test_rejects_bad_batches(self):
+        for params in ({}, {'ids': 'x'}, {'usernames': 'b1,b2', 'ids': '1,2'}):
+            self.assertEqual(self.client.get('/profiles/batch/', params).status_code, 400)
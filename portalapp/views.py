@@ -1,37 +1,96 @@
 import json
-from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, status
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveUpdateAPIView
 from .serializers import RegistrationSerializer, LoginSerializer, UserSerializer
 from .renderers import UserJSONRenderer
-from rest_framework.generics import RetrieveAPIView
-from .models import Profile
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from .models import Profile, ProfileDocument, Experience, Skill
+from .documents import load_document
+from .pagination import ProfileCursorPagination
+from .search import search
+from .matching import matching_index, skill_features
+from .export import EXPORT_FORMATS
 from .renderers import ProfileJSONRenderer
-from .serializers import ProfileSerializer
+from .serializers import ProfileSerializer, profile_fields, sparse_data
 from .exceptions import ProfileDoesNotExist
-from django.contrib.sessions.models import Session
-from .models import User
+from .cache import profile_cache
+from .conditional import loaded_profile_validators, not_modified, profile_validators
+from .conditional import media_type_validators, set_validators, sparse_validators, user_validators
+from .bulk import LIST_SECTIONS, register_users, sync_section
+from .renderers import ProfileListJSONRenderer, RegistrationBatchJSONRenderer
+from .renderers import FacetsJSONRenderer, MetricsJSONRenderer
+from .renderers import FacetsMessagePackRenderer, MetricsMessagePackRenderer, ProfileMessagePackRenderer
+from .renderers import ProfileListMessagePackRenderer, RegistrationBatchMessagePackRenderer
+from .renderers import UserMessagePackRenderer
+from .facets import facet_counts
+from .experience import days_range, filter_days
+from .instrumentation import registry
+from . import routers
 
 
 class RegistrationAPIView(APIView):
     # Allow any user (authenticated or not) to hit this endpoint.
     permission_classes = (AllowAny,)
     serializer_class = RegistrationSerializer
-    renderer_classes = (UserJSONRenderer,)
+    renderer_classes = (UserJSONRenderer, UserMessagePackRenderer)
 
     def post(self, request):
-        dct = request.data.dict()
-        jsp = json.loads(dct.keys()[0])
-        user = jsp
+        user = request.data
+        if hasattr(user, 'dict'):
+            # Older clients post the JSON document as the only key of a
+            # form body; JSON and MessagePack bodies arrive parsed.
+            user = user.dict()
+            if len(user) == 1 and not list(user.values())[0]:
+                try:
+                    user = json.loads(list(user)[0])
+                except ValueError:
+                    pass
         serializer = self.serializer_class(data=user)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        # The client comes back with the token below, which this request
+        # did not carry.
+        routers.pin_user(serializer.instance.pk)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class RegistrationBatchAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (RegistrationBatchJSONRenderer, RegistrationBatchMessagePackRenderer)
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            raise serializers.ValidationError({'users': ['Expected an object with a list of users.']})
+
+        rows = request.data.get('users')
+        limit = getattr(settings, 'REGISTRATION_BATCH_LIMIT', 1000)
+
+        if not isinstance(rows, list):
+            raise serializers.ValidationError({'users': ['Expected a list of users.']})
+
+        if len(rows) > limit:
+            raise serializers.ValidationError({
+                'users': ['Ensure this list has no more than {} users.'.format(limit)]
+            })
+
+        created, failed = register_users(rows)
+
+        return Response(
+            {'created': created, 'failed': failed},
+            status=status.HTTP_201_CREATED
+        )
+
+
 class LogoutAPIView(APIView):
 
     def get(self, request):
@@ -40,7 +99,7 @@ class LogoutAPIView(APIView):
 
 class LoginAPIView(APIView):
     permission_classes = (AllowAny,)
-    renderer_classes = (UserJSONRenderer,)
+    renderer_classes = (UserJSONRenderer, UserMessagePackRenderer)
     serializer_class = LoginSerializer
 
     def post(self, request):
@@ -53,16 +112,32 @@ class LoginAPIView(APIView):
 
 class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
     permission_classes = (IsAuthenticated,)
-    renderer_classes = (UserJSONRenderer,)
+    replica_reads = True
+    renderer_classes = (UserJSONRenderer, UserMessagePackRenderer)
     serializer_class = UserSerializer
 
     def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = media_type_validators(
+            user_validators(request.user, request.user.profile), request.accepted_renderer.media_type
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
         serializer = self.serializer_class(request.user)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(response, etag, last_modified)
 
     def update(self, request, *args, **kwargs):
-        user_data = request.data.dict()
+        user_data = request.data
+        if hasattr(user_data, 'dict'):
+            # Form bodies arrive as a QueryDict; JSON and MessagePack ones
+            # are already plain dicts.
+            user_data = user_data.dict()
+        if not isinstance(user_data, dict):
+            raise serializers.ValidationError({'user': ['Expected an object.']})
+
         serializer_data = {
             'username': user_data.get('username', request.user.username),
             'email': user_data.get('email', request.user.email),
@@ -84,33 +159,376 @@ class UserRetrieveUpdateAPIView(RetrieveUpdateAPIView):
 
 class ProfileRetrieveAPIView(RetrieveAPIView):
     permission_classes = (AllowAny,)
-    renderer_classes = (ProfileJSONRenderer,)
+    replica_reads = True
+    renderer_classes = (ProfileJSONRenderer, ProfileMessagePackRenderer)
     serializer_class = ProfileSerializer
 
     def retrieve(self, request, *args, **kwargs):
         try:
-            username = request.user.username
-            if not username:
-                session_key = request.session.session_key
-                if session_key:
-                    session = Session.objects.get(session_key=session_key)
-                    if not session:
-                        raise ProfileDoesNotExist
-                    else:
-                        session_data = session.get_decoded()
-                        uid = session_data.get('_auth_user_id')
-                        user = User.objects.get(id=uid)
-                        request.user = user
-                        username = user.username
-                else:
+            # Session logins (social auth) are resolved by SessionAuthentication,
+            # which reuses the user AuthenticationMiddleware already loaded.
+            user = request.user
+            if not user.is_authenticated:
+                raise ProfileDoesNotExist
+
+            user_id = user.pk
+            fields = profile_fields(request.query_params)
+            version = profile_cache.version(user_id)
+            cached = profile_cache.get(user_id, version)
+            if cached is None:
+                cached = self.read_document(user_id)
+                if cached is not None:
+                    self.cache(user_id, version, cached)
+
+            if cached is not None:
+                return self.respond(request, self.select(cached, fields))
+
+            # Until its document is built, conditional requests are answered
+            # from the timestamps alone and the rest load the rows. Sparse
+            # responses always take their validators from the timestamps, so
+            # the sections they leave out are never loaded.
+            conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+            if conditional or fields is not None:
+                validators = profile_validators(user_id)
+                if validators is None:
                     raise ProfileDoesNotExist
+                if fields is not None:
+                    validators = sparse_validators(validators, fields)
+                validators = media_type_validators(validators, request.accepted_renderer.media_type)
+                response = not_modified(request, *validators)
+                if response is not None:
+                    return set_validators(response, *validators)
 
-            profile = Profile.objects.select_related('user').get(
-                user__username=username
-            )
+            profile = Profile.objects.with_sections(fields).get(user_id=user_id)
         except Profile.DoesNotExist:
             raise ProfileDoesNotExist
 
-        serializer = self.serializer_class(profile)
+        if fields is not None:
+            response = Response(self.serializer_class(profile, fields=fields).data, status=status.HTTP_200_OK)
+            return set_validators(response, *validators)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        etag, last_modified = loaded_profile_validators(profile)
+        cached = {
+            'data': self.serializer_class(profile).data,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        self.cache(user_id, version, cached)
+
+        return self.respond(request, cached)
+
+    def cache(self, user_id, version, cached):
+        # A lagging replica could still return the profile as it was before
+        # the write that bumped `version`; only primary reads are cached.
+        if not routers.reading_replicas():
+            profile_cache.set(user_id, version, cached)
+
+    def read_document(self, user_id):
+        # The denormalized document answers in a single-row lookup.
+        document = ProfileDocument.objects.filter(profile__user_id=user_id).values_list(
+            'data', 'etag', 'last_modified'
+        ).order_by('profile_id').first()
+        if document is None:
+            return None
+
+        data, etag, last_modified = document
+        return {'data': load_document(data), 'etag': etag, 'last_modified': last_modified}
+
+    def select(self, cached, fields):
+        if fields is None:
+            return cached
+
+        return {
+            'data': sparse_data(cached['data'], fields),
+            'etag': sparse_validators((cached['etag'], cached['last_modified']), fields)[0],
+            'last_modified': cached['last_modified'],
+        }
+
+    def respond(self, request, cached):
+        etag, last_modified = media_type_validators(
+            (cached['etag'], cached['last_modified']), request.accepted_renderer.media_type
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = Response(cached['data'], status=status.HTTP_200_OK)
+        return set_validators(response, etag, last_modified)
+
+
+class ProfileSectionAPIView(APIView):
+    # PUT replaces one list section (experience, education, skills or
+    # projects) of the caller's profile with the given entries, writing only
+    # the rows that differ.
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (ProfileJSONRenderer, ProfileMessagePackRenderer)
+
+    def put(self, request, section):
+        model, serializer_class = {
+            key: (section_model, section_serializer)
+            for key, section_model, section_serializer in LIST_SECTIONS
+        }[section]
+
+        entries = request.data
+        if isinstance(entries, dict):
+            entries = entries.get(section)
+        if not isinstance(entries, list):
+            raise serializers.ValidationError({section: ['Expected a list of entries.']})
+
+        serializer = serializer_class(data=entries, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            profile = Profile.objects.only('pk', 'user_id').get(user_id=request.user.pk)
+        except Profile.DoesNotExist:
+            raise ProfileDoesNotExist
+
+        changes = sync_section(profile, section, serializer.validated_data)
+        rows = model.objects.filter(profile_id=profile.pk).select_related('profile__user')
+
+        return Response({
+            section: serializer_class(rows, many=True).data,
+            'changes': changes,
+        }, status=status.HTTP_200_OK)
+
+
+def experience_days_range(params):
+    # ?min_years=3&max_years=5, matched against the precomputed totals.
+    try:
+        return days_range(*[
+            float(params[name]) if params.get(name) else None
+            for name in ('min_years', 'max_years')
+        ])
+    except (ValueError, OverflowError):
+        raise serializers.ValidationError({'error': ['min_years and max_years must be numbers.']})
+
+
+class ProfileListAPIView(ListAPIView):
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    renderer_classes = (ProfileListJSONRenderer, ProfileListMessagePackRenderer)
+    serializer_class = ProfileSerializer
+    pagination_class = ProfileCursorPagination
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = Profile.objects.with_sections(profile_fields(params))
+
+        state = params.get('state')
+        if state:
+            queryset = queryset.filter(basic__state=state)
+
+        city = params.get('city')
+        if city:
+            queryset = queryset.filter(basic__city=city)
+
+        # Subqueries keep a profile with several matching rows from
+        # appearing twice and use the (skill, profile) / (company, profile)
+        # indexes.
+        skill = params.get('skill')
+        if skill:
+            queryset = queryset.filter(
+                pk__in=Skill.objects.filter(skill=skill).values('profile_id')
+            )
+
+        company = params.get('company')
+        if company:
+            queryset = queryset.filter(
+                pk__in=Experience.objects.filter(company=company).values('profile_id')
+            )
+
+        return filter_days(queryset, *experience_days_range(params))
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = profile_fields(self.request.query_params)
+        return super(ProfileListAPIView, self).get_serializer(*args, **kwargs)
+
+
+class SearchAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    renderer_classes = (ProfileListJSONRenderer, ProfileListMessagePackRenderer)
+    serializer_class = ProfileSerializer
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            raise serializers.ValidationError({'error': ['limit and offset must be integers.']})
+        if limit < 1 or offset < 0:
+            raise serializers.ValidationError({'error': ['limit must be positive and offset not negative.']})
+
+        min_days, max_days = experience_days_range(request.query_params)
+        fields = profile_fields(request.query_params)
+        count, ranked = search(query, limit=limit, offset=offset, min_days=min_days, max_days=max_days)
+        profiles = Profile.objects.with_sections(fields).in_bulk([pk for pk, _ in ranked])
+
+        results = []
+        for pk, score in ranked:
+            if pk in profiles:
+                data = self.serializer_class(profiles[pk], fields=fields).data
+                data['score'] = round(score, 4)
+                results.append(data)
+
+        return Response({'count': count, 'results': results}, status=status.HTTP_200_OK)
+
+
+class MatchingAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    renderer_classes = (ProfileListJSONRenderer, ProfileListMessagePackRenderer)
+    serializer_class = ProfileSerializer
+
+    def get_limit(self, request):
+        try:
+            return max(min(int(request.query_params.get('limit', 10)), 50), 1)
+        except ValueError:
+            raise serializers.ValidationError({'error': ['limit must be an integer.']})
+
+    def respond(self, ranked):
+        fields = profile_fields(self.request.query_params)
+        profiles = Profile.objects.with_sections(fields).in_bulk([pk for pk, _ in ranked])
+
+        results = []
+        for pk, score in ranked:
+            if pk in profiles:
+                data = self.serializer_class(profiles[pk], fields=fields).data
+                data['score'] = round(score, 4)
+                results.append(data)
+
+        return Response({'count': len(results), 'results': results}, status=status.HTTP_200_OK)
+
+
+class SimilarProfilesAPIView(MatchingAPIView):
+    def get(self, request, username):
+        profile_id = Profile.objects.filter(user__username=username).values_list(
+            'pk', flat=True
+        ).first()
+        if profile_id is None:
+            raise ProfileDoesNotExist
+
+        return self.respond(matching_index.similar(profile_id, limit=self.get_limit(request)))
+
+
+class SkillMatchAPIView(MatchingAPIView):
+    def get(self, request):
+        skills = [skill for skill in request.query_params.get('skills', '').split(',') if skill.strip()]
+        if not skills:
+            raise serializers.ValidationError({'skills': ['Give a comma-separated list of skills.']})
+
+        return self.respond(matching_index.match(skill_features(skills), limit=self.get_limit(request)))
+
+
+class ProfileBatchAPIView(APIView):
+    # GET /profiles/batch/?usernames=a,b&ids=3,4 returns up to
+    # PROFILE_BATCH_LIMIT profiles keyed by username, with the keys that
+    # matched no profile listed under "missing". Ids are user ids, as in
+    # the token payload.
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    renderer_classes = (ProfileListJSONRenderer, ProfileListMessagePackRenderer)
+    serializer_class = ProfileSerializer
+
+    def get_keys(self, request):
+        params = request.query_params
+        usernames = [name.strip() for name in params.get('usernames', '').split(',') if name.strip()]
+        try:
+            ids = [int(pk) for pk in params.get('ids', '').split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError({'ids': ['Expected a comma-separated list of integers.']})
+
+        usernames = list(OrderedDict.fromkeys(usernames))
+        ids = list(OrderedDict.fromkeys(ids))
+        limit = getattr(settings, 'PROFILE_BATCH_LIMIT', 100)
+        if not usernames and not ids:
+            raise serializers.ValidationError({'error': ['Give usernames or ids.']})
+        if len(usernames) + len(ids) > limit:
+            raise serializers.ValidationError({
+                'error': ['Ensure the batch has no more than {} profiles.'.format(limit)]
+            })
+
+        return usernames, ids
+
+    def get(self, request):
+        usernames, ids = self.get_keys(request)
+        fields = profile_fields(request.query_params)
+
+        # Denormalized documents answer the batch in one query; profiles
+        # whose document is not built yet are loaded with their sections.
+        found = {}
+        for user_id, username, data in ProfileDocument.objects.filter(
+            Q(profile__user__username__in=usernames) | Q(profile__user_id__in=ids)
+        ).values_list('profile__user_id', 'profile__user__username', 'data'):
+            found[user_id] = (username, sparse_data(load_document(data), fields))
+
+        found_usernames = {username for username, _ in found.values()}
+        if any(name not in found_usernames for name in usernames) or any(pk not in found for pk in ids):
+            profiles = Profile.objects.with_sections(fields).filter(
+                Q(user__username__in=usernames) | Q(user_id__in=ids)
+            ).exclude(user_id__in=list(found))
+            for profile in profiles:
+                found[profile.user_id] = (
+                    profile.user.username, self.serializer_class(profile, fields=fields).data
+                )
+
+        by_username = {username: (user_id, data) for user_id, (username, data) in found.items()}
+        results = OrderedDict()
+        missing = {'usernames': [], 'ids': []}
+        for username in usernames:
+            if username in by_username:
+                results[username] = by_username[username][1]
+            else:
+                missing['usernames'].append(username)
+        for user_id in ids:
+            if user_id in found:
+                results[found[user_id][0]] = found[user_id][1]
+            else:
+                missing['ids'].append(user_id)
+
+        return Response({'results': results, 'missing': missing}, status=status.HTTP_200_OK)
+
+
+class FacetsAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+    replica_reads = True
+    renderer_classes = (FacetsJSONRenderer, FacetsMessagePackRenderer)
+
+    def get(self, request):
+        try:
+            limit = max(min(int(request.query_params.get('limit', 50)), 500), 1)
+        except ValueError:
+            raise serializers.ValidationError({'error': ['limit must be an integer.']})
+
+        return Response(facet_counts(limit=limit), status=status.HTTP_200_OK)
+
+
+class ProfileExportAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (ProfileListJSONRenderer, ProfileListMessagePackRenderer)
+
+    def get(self, request):
+        # Not "format": DRF reserves that parameter for renderer selection.
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise serializers.ValidationError({
+                'output': ['Expected one of: {}.'.format(', '.join(sorted(EXPORT_FORMATS)))]
+            })
+
+        iterator, content_type = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(iterator(), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="profiles.{}"'.format(output)
+
+        return response
+
+
+class MetricsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (MetricsJSONRenderer, MetricsMessagePackRenderer)
+
+    def get(self, request):
+        return Response(registry.snapshot(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        registry.reset()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)